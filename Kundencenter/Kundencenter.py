@@ -1,11 +1,11 @@
 import requests
-import time
 import streamlit as st
 import plotly.express as px
-import random
 import datetime
 
 from collections import Counter, defaultdict
+from functions import shared_api_client
+from charts import FigureTemplate
 
 def get_most_important_keys(disagg_dicts, top_n=5):
     """
@@ -34,74 +34,6 @@ def get_most_important_keys(disagg_dicts, top_n=5):
     
     return most_common_keys, highest_sum_keys, all_categories
 
-class APIClient:
-    BASE_URL = "https://smart-meter-reseller-api.voltaware.com"
-    TOKEN_ENDPOINT = "/auth/token"
-    REFRESH_ENDPOINT = "/auth/token/refresh"
-
-    def __init__(self, client_id, client_secret):
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.access_token = None
-        self.refresh_token = None
-        self.token_expiry = 0
-
-    def authenticate(self):
-        """Authenticate and retrieve the initial access token."""
-        url = f"{self.BASE_URL}{self.TOKEN_ENDPOINT}"
-        payload = {
-            "grant_type": "client_credentials",
-            "client_id": self.client_id,
-            "client_secret": self.client_secret
-        }
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        data = response.json()
-        self._update_tokens(data)
-
-    def refresh_access_token(self):
-        """Refresh the access token using the refresh token."""
-        url = f"{self.BASE_URL}{self.REFRESH_ENDPOINT}"
-        payload = {
-            "grant_type": "refresh_token",
-            "client_id": self.client_id,
-            "refresh_token": self.refresh_token
-        }
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        data = response.json()
-        self._update_tokens(data)
-
-    def _update_tokens(self, data):
-        """Update the tokens and expiry time."""
-        self.access_token = data["access_token"]
-        self.token_expiry = time.time() + data["expires_in_secs"]
-        self.refresh_token = data.get("refresh_token")  # Only present in initial auth
-
-    def get_access_token(self):
-        """Get a valid access token, refreshing it if necessary."""
-        if time.time() >= self.token_expiry:
-            self.refresh_access_token()
-        return self.access_token
-
-    def get_disaggregation_results(self, sensor_id, date):
-        """Retrieve disaggregation results for a sensor on a specific date."""
-        url = f"https://reseller-api.voltaware.com/sensors/{sensor_id}/disag/day?date={date}"
-        
-        headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-
-    def get_live_power(self, sensor_id):
-        """Retrieve live power data for a sensor."""
-        url = f"https://reseller-api.voltaware.com/sensors/{sensor_id}/stats/live"
-        
-        headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-
 def make_grid(cols,rows):
     grid = [0]*cols
     for i in range(cols):
@@ -115,12 +47,33 @@ def get_all_disaggregation_keys_sorted_by_sum(sensors):
     sorted by their summed values (highest first).
     """
     value_sums = defaultdict(float)
-    for sensor in sensors.values():
+    for sensor in sensors:
         for k, v in sensor.get("disaggregation", {}).items():
             value_sums[k] += v
     return [k for k, _ in sorted(value_sums.items(), key=lambda item: item[1], reverse=True)]
 
 # Streamlit Web App
+# Refresh interval of the live values and pie charts (seconds)
+REFRESH_SECS = 10
+
+def build_pie(labels, colors):
+    """Donut chart template for one set of disaggregation categories; the values are patched in per update"""
+    fig = px.pie(
+        values=[1] * len(labels),
+        names=list(labels),
+        color=list(labels),
+        color_discrete_map=dict(zip(labels, colors)),
+        hole=0.4
+    )
+    fig.update_layout(showlegend=False)
+    fig.update_traces(textposition="inside")
+    # Set smaller margins and chart size
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),  # left, right, top, bottom
+        height=250,  # adjust as needed
+    )
+    return fig
+
 def run_streamlit_app(api_client):
 
     import plotly.colors
@@ -173,25 +126,29 @@ def run_streamlit_app(api_client):
         # Add more mappings as needed
     }
 
-    dis = []
+    # Pie chart templates per (sensor, categories, colors)
+    pie_templates = {}
 
-    placeholder = st.empty()
     # Create two columns for the layout
     grid = make_grid(3,3)
 
-    while True:
+    # Only this fragment reruns on every refresh; the charts keep stable keys, so the browser
+    # updates the mounted components instead of creating new ones
+    @st.fragment(run_every=REFRESH_SECS)
+    def sensor_grid():
+        dis = []
         current_time = datetime.datetime.now().time()
 
         yesterday = (datetime.datetime.now() - datetime.timedelta(days=10)).strftime("%Y-%m-%d")
 
-        for i, sensor_id in enumerate(sensors):
+        for i, sensor in enumerate(sensors):
             try:
                 # Fetch disaggregation results for the sensor
-                data = api_client.get_disaggregation_results(sensor_id, yesterday)
-                sensors[sensor_id]["disaggregation"] = data.get("consumption", {})
-                dis.append(sensors[sensor_id]["disaggregation"])
+                data = api_client.get_disaggregation_results(sensor["sensor_id"], yesterday)
+                sensor["disaggregation"] = data.get("consumption", {})
+                dis.append(sensor["disaggregation"])
             except requests.exceptions.RequestException as e:
-                    st.error(f"Error fetching data for sensor {sensors[sensor_id]["name"]}: {e}")
+                    st.error(f"Error fetching data for sensor {sensor['name']}: {e}")
 
         all_keys = get_all_disaggregation_keys_sorted_by_sum(sensors)
 
@@ -204,94 +161,76 @@ def run_streamlit_app(api_client):
         ]
         color_map = {key: palette[i % len(palette)] for i, key in enumerate(all_keys)}
 
-
-        with placeholder.container():
-                    # Draw custom legend in a single row using all_keys and color_map
-            
-
-            # create three columns
-            col1, col2, col3 = st.columns(3)
-
-            # Fetch and display results for each sensor
-            for i, sensor_id in enumerate(sensors):
-                consumption = sensors[sensor_id]["disaggregation"]
-                consumption_labels = list(consumption.keys())
-                consumption_values = list(consumption.values())
-
-                data_live = api_client.get_live_power(sensor_id)
-                live_power = data_live.get("consumption", {}).get("actualRaw", 0)/1000 # Convert from W to kW
-                delta = sensors[sensor_id]["prev_val"] - live_power
-                sensors[sensor_id]["prev_val"] = live_power
-                # Create the pie chart using Plotly with color mapping and no legend
-                fig = px.pie(
-                    values=consumption_values,
-                    names=consumption_labels,
-                    color=consumption_labels,
-                    color_discrete_map=color_map,
-                    hole=0.4
-                )
-                fig.update_layout(showlegend=False)
-                fig.update_traces(textposition="inside")
-                # Set smaller margins and chart size
-                fig.update_layout(
-                    margin=dict(l=0, r=0, t=0, b=0),  # left, right, top, bottom
-                    height=250,  # adjust as needed
-                )
-
-                col_index = i % 3
-                if col_index == 0:
-                    with col1:
-                        st.metric(
-                            label=f"{sensors[sensor_id]['name']}",
-                            value=f"{live_power:.2f} kW",
-                            delta=f"{delta:.2f} kW",
-                            delta_color="inverse" 
-                        )
-                        st.plotly_chart(fig, key=f"{time.time()+random.randint(0, 100)}")
-                elif col_index == 1:
-                    with col2:
-                        st.metric(
-                            label=f"{sensors[sensor_id]['name']}",
-                            value=f"{live_power:.2f} kW",
-                            delta=f"{delta:.2f} kW",
-                            delta_color="inverse"
-                        )
-                        st.plotly_chart(fig, key=f"{time.time()+random.randint(0, 100)}")
-                elif col_index == 2:
-                    with col3:
-                        st.metric(
-                            label=f"{sensors[sensor_id]['name']}",
-                            value=f"{live_power:.2f} kW",
-                            delta=f"{delta:.2f} kW",
-                            delta_color="inverse"
-                        )
-                        st.plotly_chart(fig, key=f"{time.time()+random.randint(0, 100)}")
+        # create three columns
+        col1, col2, col3 = st.columns(3)
+
+        # Fetch and display results for each sensor
+        for i, sensor in enumerate(sensors):
+            consumption = sensor.get("disaggregation", {})
+            consumption_labels = list(consumption.keys())
+            consumption_values = list(consumption.values())
+
+            live_power = api_client.get_live_power(sensor["sensor_id"])/1000 # Convert from W to kW
+            delta = sensor.get("prev_val", live_power) - live_power
+            sensor["prev_val"] = live_power
+            # Pie chart with color mapping and no legend; the template is only rebuilt if the categories change
+            labels = tuple(consumption_labels)
+            template_key = (sensor["sensor_id"], labels, tuple(color_map[k] for k in labels))
+            if template_key not in pie_templates:
+                pie_templates[template_key] = FigureTemplate(build_pie(*template_key[1:]))
+            fig = pie_templates[template_key].patch({0: {"values": consumption_values}})
+
+            col_index = i % 3
+            if col_index == 0:
+                with col1:
+                    st.metric(
+                        label=f"{sensor['name']}",
+                        value=f"{live_power:.2f} kW",
+                        delta=f"{delta:.2f} kW",
+                        delta_color="inverse" 
+                    )
+                    st.plotly_chart(fig, key=f"pie_{sensor['sensor_id']}")
+            elif col_index == 1:
+                with col2:
+                    st.metric(
+                        label=f"{sensor['name']}",
+                        value=f"{live_power:.2f} kW",
+                        delta=f"{delta:.2f} kW",
+                        delta_color="inverse"
+                    )
+                    st.plotly_chart(fig, key=f"pie_{sensor['sensor_id']}")
+            elif col_index == 2:
+                with col3:
+                    st.metric(
+                        label=f"{sensor['name']}",
+                        value=f"{live_power:.2f} kW",
+                        delta=f"{delta:.2f} kW",
+                        delta_color="inverse"
+                    )
+                    st.plotly_chart(fig, key=f"pie_{sensor['sensor_id']}")
+        
+        legend_html = ""
+        for key in all_keys:
+            color = color_map[key]
+            label = predefined_labels.get(key, key)
             
-            legend_html = ""
-            for key in all_keys:
-                color = color_map[key]
-                label = predefined_labels.get(key, key)
-                
-                legend_html += (
-                    f'<span style="display:inline-block;width:16px;height:16px;background-color:{color};'
-                    f'margin-right:8px;border-radius:3px;vertical-align:middle;"></span>'
-                    f'<span style="margin-right:18px;vertical-align:middle;">{label}</span>'
-                )
-            st.markdown("<div style='height:40px;'></div>", unsafe_allow_html=True)
-            st.markdown(legend_html, unsafe_allow_html=True)
-                   
+            legend_html += (
+                f'<span style="display:inline-block;width:16px;height:16px;background-color:{color};'
+                f'margin-right:8px;border-radius:3px;vertical-align:middle;"></span>'
+                f'<span style="margin-right:18px;vertical-align:middle;">{label}</span>'
+            )
+        st.markdown("<div style='height:40px;'></div>", unsafe_allow_html=True)
+        st.markdown(legend_html, unsafe_allow_html=True)
 
-        #if (current_time > update_time):
-        #    st.rerun()
-        time.sleep(10)
+    sensor_grid()
 
 # Example usage:
 if __name__ == "__main__":
-    client_id = st.secrets["client_id"]  # Replace with your client ID
-    client_secret = st.secrets["client_secret"]  # Replace with your client secret
-
-    api_client = APIClient(client_id, client_secret)
-    api_client.authenticate()
+    # Credentials and optional overrides (mock_server.py, record/replay of API traffic) come from the
+    # secrets; the client is created once per process and shared by all sessions and reruns
+    api_client = shared_api_client(st.secrets)
+    # Only authenticates if the shared token manager has no valid token yet
+    api_client.get_access_token()
 
     # Run the Streamlit app
-    run_streamlit_app(api_client)
\ No newline at end of file
+    run_streamlit_app(api_client)
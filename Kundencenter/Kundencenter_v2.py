@@ -2,6 +2,7 @@ import streamlit as st
 import plotly.graph_objects as go
 import numpy as np
 import time
+from charts import FigureTemplate
 
 st.set_page_config(layout="wide")
 st.title("BE-Kundencenter Energy Dashboard")
@@ -37,22 +38,34 @@ def plot_gauges(items):
     )
     return fig
 
-def plot_bar(items, value_key, title):
+def build_bar(names, colors, title):
     fig = go.Figure(go.Bar(
-        y=[item["name"] for item in items],
-        x=[item[value_key] for item in items],
+        y=list(names),
+        x=[0] * len(names),
         orientation='h',
-        marker_color=[item["color"] for item in items],
-        text=[item[value_key] for item in items],
+        marker_color=list(colors),
         textposition='outside'
     ))
     fig.update_layout(
         title=title,
-        xaxis=dict(range=[0, max(item[value_key] for item in items) * 1.15]),
         height=500
     )
     return fig
 
+def plot_bar(items, value_key, title):
+    # One template per bar layout; only the values and the axis range change between reruns
+    names = tuple(item["name"] for item in items)
+    colors = tuple(item["color"] for item in items)
+    templates = st.session_state.setdefault("bar_templates", {})
+    key = (value_key, title, names, colors)
+    if key not in templates:
+        templates[key] = FigureTemplate(build_bar(names, colors, title))
+    values = [item[value_key] for item in items]
+    return templates[key].patch(
+        {0: {"x": values, "text": values}},
+        {"xaxis.range": [0, max(values) * 1.15]},
+    )
+
 # --- SESSION STATE FOR TIMERS ---
 if 'last_gauge_update' not in st.session_state:
     st.session_state.last_gauge_update = 0
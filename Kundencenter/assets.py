@@ -0,0 +1,72 @@
+"""Image assets of the dashboards, loaded and encoded once per process.
+
+Images are looked up by name in img/ next to this module (case-insensitive, so "güssing" and
+"Eisenstadt" both resolve) and returned as data URIs, pre-resized to the height they are shown at.
+"""
+import base64
+import io
+import os
+import threading
+import unicodedata
+from functools import lru_cache
+
+from PIL import Image, features
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "img")
+# Images are resized to this multiple of their display height, so they stay sharp on HiDPI screens
+PIXEL_RATIO = 2
+# Resized images are stored as WebP (with alpha) where Pillow supports it, which is a fraction of the PNG size
+RESIZED_FORMAT = "WEBP" if features.check("webp") else "PNG"
+
+_lock = threading.Lock()
+
+def _normalize(name):
+    return unicodedata.normalize("NFC", name).lower()
+
+@lru_cache(maxsize=None)
+def _index(directory):
+    """Map the normalized file name stem of every image in directory to its path."""
+    index = {}
+    for file_name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        stem, ext = os.path.splitext(file_name)
+        if ext.lower() in (".png", ".jpg", ".jpeg"):
+            index.setdefault(_normalize(stem), os.path.join(directory, file_name))
+    return index
+
+def find_image(name, directory=IMG_DIR):
+    """Return the path of the image called name (without extension), or None if there is none."""
+    return _index(directory).get(_normalize(name))
+
+def _encode(path, height):
+    """Return (mime type, bytes) of the image, scaled down to height pixels if it is taller."""
+    with Image.open(path) as image:
+        if height is None or image.height <= height:
+            with open(path, "rb") as f:
+                return Image.MIME.get(image.format, "image/png"), f.read()
+        image = image.resize((round(image.width * height / image.height), height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if RESIZED_FORMAT == "WEBP":
+            image.save(buffer, format="WEBP", quality=85, method=6)
+        else:
+            image.save(buffer, format="PNG", optimize=True)
+        return Image.MIME[RESIZED_FORMAT], buffer.getvalue()
+
+@lru_cache(maxsize=64)
+def _data_uri(path, height):
+    mime, data = _encode(path, height)
+    uri = f"data:{mime};base64,{base64.b64encode(data).decode()}"
+    print(f"DEBUG: Encoded {os.path.basename(path)} for height {height} ({len(uri)} chars)")
+    return uri
+
+def image_data_uri(name, display_height=None, directory=IMG_DIR):
+    """Return the image called name as a data URI for <img src>, or None if it does not exist.
+    With display_height (CSS pixels) the image is resized to PIXEL_RATIO times that height first.
+    The result is cached for the lifetime of the process.
+    """
+    path = find_image(name, directory)
+    if path is None:
+        return None
+    height = display_height * PIXEL_RATIO if display_height else None
+    # Serialize the first encode of an image, so concurrent sessions don't all resize it at once
+    with _lock:
+        return _data_uri(path, height)
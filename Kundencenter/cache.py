@@ -0,0 +1,108 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+def object_size(value):
+    """Estimate the memory used by a decoded JSON value (dicts, lists, strings, numbers) in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(object_size(k) + object_size(v) for k, v in value.items())
+    elif isinstance(value, list):
+        size += sum(object_size(v) for v in value)
+    return size
+
+class ResponseCache:
+    """In-memory LRU cache for API responses.
+    Entries expire after a per-entry TTL (None = never), the total size is capped at max_bytes,
+    and concurrent requests for the same key are coalesced into a single load.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # key -> (expires_at, size, value), least recently used first
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for key, or call loader() -> (value, size) and cache the result.
+        size should be the memory the value occupies (see object_size), not its encoded length.
+        If the same key is already being loaded, wait for that load instead of starting another.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+
+            future = self.in_flight.get(key)
+            leader = future is None
+            if not leader:
+                self.coalesced += 1
+            else:
+                future = Future()
+                self.in_flight[key] = future
+                self.misses += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value, size = loader()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.in_flight[key]
+            if ttl != 0 and size <= self.max_bytes:
+                expires_at = None if ttl is None else time.monotonic() + ttl
+                if key in self.entries:
+                    self._remove(key)
+                self.entries[key] = (expires_at, size, value)
+                self.size += size
+                self._evict()
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        """Return the hit/miss counters and the current size."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.size,
+            }
+
+    def clear(self):
+        """Drop all cached entries (counters are kept)."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def _evict(self):
+        """Drop least recently used entries until the size fits the cap."""
+        while self.size > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            self._remove(key)
+            self.evictions += 1
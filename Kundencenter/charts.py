@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+import numpy as np
+
+def lttb(x, y, threshold):
+    """Downsample (x, y) to `threshold` points with Largest-Triangle-Three-Buckets.
+    The first and last points are kept; from every bucket in between the point forming the largest
+    triangle with the previously kept point and the average of the next bucket is kept.
+    x must be sorted. Returns the input unchanged if it has no more than threshold points.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # Bucket boundaries for the n - 2 inner points, plus the averages of every bucket in one pass
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    counts = np.diff(edges)
+    x_avg = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    y_avg = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # The "next bucket" of the last inner bucket is the last point
+    x_next = np.append(x_avg[1:], x[-1])
+    y_next = np.append(y_avg[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Twice the triangle area for all candidates of the bucket at once
+        area = np.abs(
+            (x[a] - x_next[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (y_next[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+class FigureTemplate:
+    """A Plotly figure built once and reused for every frame, with only the changing fields patched in place.
+    Each assignment is validated on its own instead of building and validating a whole new figure.
+    Templates are mutable, so one template must only be used by one session at a time.
+    """
+
+    def __init__(self, figure):
+        self.figure = figure
+
+    def patch(self, trace_updates=None, layout_updates=None):
+        """Set trace properties, e.g. {0: {"value": 42, "gauge.threshold.value": 42}}, and layout
+        properties, e.g. {"xaxis.range": [0, 10]}, and return the figure.
+        """
+        for index, updates in (trace_updates or {}).items():
+            trace = self.figure.data[index]
+            for path, value in updates.items():
+                trace[path] = value
+        for path, value in (layout_updates or {}).items():
+            self.figure.layout[path] = value
+        return self.figure
+
+@lru_cache(maxsize=None)
+def gauge_gradient(num_steps=20):
+    """Colors of a green -> yellow -> red gradient in num_steps steps, as 'rgb(r,g,b)' strings."""
+    colors = []
+    for i in range(num_steps):
+        # Calculate progress from 0 to 1
+        progress = i / (num_steps - 1)
+        if progress <= 0.5:
+            # Green to Yellow transition (first half)
+            # Green: #0EB313, Yellow: #FFFF00
+            red = int(14 + (255 - 14) * (progress * 2))
+            green = int(179 + (255 - 179) * (progress * 2))
+            blue = int(19 * (1 - progress * 2))
+        else:
+            # Yellow to Red transition (second half)
+            # Yellow: #FFFF00, Red: #F44336
+            red = int(255 + (244 - 255) * ((progress - 0.5) * 2))
+            green = int(255 + (67 - 255) * ((progress - 0.5) * 2))
+            blue = int(0 + (54 - 0) * ((progress - 0.5) * 2))
+        colors.append(f"rgb({max(0, min(255, red))},{max(0, min(255, green))},{max(0, min(255, blue))})")
+    return tuple(colors)
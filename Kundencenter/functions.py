@@ -1,129 +1,385 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, List, Tuple
+import threading
 import time
+from cache import ResponseCache, object_size
+from tracing import TraceRecorder, TraceReplayer
+from series import DailySeries
+from store import DailyMetricsStore, date_range, date_runs
 
-class APIClient:
-    BASE_URL = "https://smart-meter-reseller-api.voltaware.com"
+def create_session(pool_size):
+    """Create a requests session with a connection pool of the given size."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class TokenManager:
+    """Holds the access token for one set of credentials.
+    One instance per process is shared by all untraced APIClients (see TokenManager.shared), the token is
+    renewed in the background ahead of its expiry and only one auth request is in flight at a time.
+    Clients release it when they are closed; its session is closed once the last client is gone.
+    """
     TOKEN_ENDPOINT = "/auth/token"
     REFRESH_ENDPOINT = "/auth/token/refresh"
 
-    def __init__(self, client_id, client_secret):
+    # Seconds before expiry at which a background renewal is started
+    REFRESH_MARGIN = 60
+    # Seconds before expiry at which callers wait for a renewal instead of using the old token
+    EXPIRY_SAFETY = 5
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, base_url, client_id, client_secret, timeout=(3.05, 10), pool_size=10):
+        """Return the process-wide token manager for these credentials, creating it on first use.
+        Every call must be paired with a release().
+        """
+        key = (base_url, client_id)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(base_url, client_id, client_secret, timeout, pool_size)
+            manager = cls._instances[key]
+            manager.users += 1
+            return manager
+
+    def __init__(self, base_url, client_id, client_secret, timeout=(3.05, 10), pool_size=10):
+        self.base_url = base_url
         self.client_id = client_id
         self.client_secret = client_secret
+        self.timeout = timeout
+        # Keep-alive session for the auth host
+        self.session = create_session(pool_size)
+        # Number of clients holding this manager (see shared and release)
+        self.users = 0
         self.access_token = None
         self.refresh_token = None
         self.token_expiry = 0
+        self.refresh_at = 0
+        self.usable_until = 0
+        # Held while an auth request is in flight
+        self.lock = threading.Lock()
+
+    def release(self):
+        """Drop one user of a shared manager; the last one closes the session and removes it from the registry."""
+        with self._instances_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if self._instances.get((self.base_url, self.client_id)) is self:
+                del self._instances[(self.base_url, self.client_id)]
+        self.session.close()
 
     def authenticate(self):
         """Authenticate and retrieve the initial access token."""
-        url = f"{self.BASE_URL}{self.TOKEN_ENDPOINT}"
+        with self.lock:
+            self._authenticate()
+
+    def refresh_access_token(self):
+        """Refresh the access token, falling back to authenticate if that is not possible."""
+        with self.lock:
+            self._renew()
+
+    def get_access_token(self):
+        """Get a valid access token without waiting for auth unless the token is (almost) expired."""
+        now = time.time()
+        if now < self.refresh_at:
+            return self.access_token
+        if now < self.usable_until:
+            self._renew_in_background()
+            return self.access_token
+
+        with self.lock:
+            # Another caller may have renewed the token while we were waiting
+            if time.time() >= self.usable_until:
+                self._renew()
+        return self.access_token
+
+    def invalidate(self, rejected_token):
+        """Renew the token after the API rejected it, unless another caller already did."""
+        with self.lock:
+            if self.access_token == rejected_token:
+                self._renew()
+        return self.access_token
+
+    def _renew_in_background(self):
+        """Start a renewal in a background thread unless one is already in flight."""
+        if not self.lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._renew()
+            except Exception as e:
+                print(f"DEBUG: Background token renewal failed: {e}")
+            finally:
+                self.lock.release()
+
+        threading.Thread(target=run, name="voltaware-token", daemon=True).start()
+
+    def _renew(self):
+        """Refresh the token, or authenticate if there is no refresh token or it was rejected."""
+        if self.refresh_token:
+            try:
+                self._refresh()
+                return
+            except requests.exceptions.RequestException as e:
+                print(f"DEBUG: Token refresh failed, authenticating again: {e}")
+        self._authenticate()
+
+    def _authenticate(self):
+        url = f"{self.base_url}{self.TOKEN_ENDPOINT}"
         payload = {
             "grant_type": "client_credentials",
             "client_id": self.client_id,
             "client_secret": self.client_secret
         }
-        response = requests.post(url, json=payload)
+        response = self.session.post(url, json=payload, timeout=self.timeout)
         response.raise_for_status()
-        data = response.json()
-        self._update_tokens(data)
+        self._update_tokens(response.json())
 
-    def refresh_access_token(self):
-        """Refresh the access token using the refresh token."""
-        url = f"{self.BASE_URL}{self.REFRESH_ENDPOINT}"
+    def _refresh(self):
+        url = f"{self.base_url}{self.REFRESH_ENDPOINT}"
         payload = {
             "grant_type": "refresh_token",
             "client_id": self.client_id,
             "refresh_token": self.refresh_token
         }
-        response = requests.post(url, json=payload)
+        response = self.session.post(url, json=payload, timeout=self.timeout)
         response.raise_for_status()
-        data = response.json()
-        self._update_tokens(data)
+        self._update_tokens(response.json())
 
     def _update_tokens(self, data):
         """Update the tokens and expiry time."""
+        lifetime = data["expires_in_secs"]
+        now = time.time()
         self.access_token = data["access_token"]
-        self.token_expiry = time.time() + data["expires_in_secs"]
-        self.refresh_token = data.get("refresh_token")  # Only present in initial auth
+        self.token_expiry = now + lifetime
+        self.refresh_at = now + lifetime - min(self.REFRESH_MARGIN, lifetime / 2)
+        self.usable_until = now + lifetime - min(self.EXPIRY_SAFETY, lifetime / 10)
+        # Only present in initial auth, keep the previous one otherwise
+        self.refresh_token = data.get("refresh_token", self.refresh_token)
+
+class APIClient:
+    BASE_URL = "https://smart-meter-reseller-api.voltaware.com"
+    RESELLER_URL = "https://reseller-api.voltaware.com"
+
+    # Response cache TTLs in seconds; closed days are cached without expiry
+    LIVE_TTL = 5
+    OPEN_DAY_TTL = 300
+
+    def __init__(self, client_id, client_secret, pool_size=10, connect_timeout=3.05, read_timeout=10, store=None,
+                 cache_max_bytes=32 * 1024 * 1024, base_url=None, reseller_url=None,
+                 trace_mode=None, trace_path=None, replay_speed=1.0):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        # Base URLs can be overridden, e.g. to point the client at mock_server.py
+        self.base_url = base_url or self.BASE_URL
+        self.reseller_url = reseller_url or self.RESELLER_URL
+        # Optional DailyMetricsStore for closed days, consulted before the API
+        self.store = store
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        if trace_mode not in (None, "record", "replay"):
+            raise ValueError(f"Unknown trace mode: {trace_mode}")
+        if trace_mode is None:
+            # Token handling is shared by all clients of this process
+            self.tokens = TokenManager.shared(self.base_url, client_id, client_secret, self.timeout, pool_size)
+        else:
+            # A traced client gets its own token manager, so the tracer does not hook the auth
+            # requests of other clients with the same credentials
+            self.tokens = TokenManager(self.base_url, client_id, client_secret, self.timeout, pool_size)
+            self.tokens.users = 1
+        # Keep-alive session for the reseller API, so repeated calls reuse warm connections
+        self.reseller_session = create_session(pool_size)
+        # Cache for identical requests from several sessions or within the TTL
+        self.cache = ResponseCache(cache_max_bytes)
+        # Worker threads for concurrent fan-out over several sensors
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="voltaware")
+        # Record all traffic to a trace file, or serve it from one ("record" / "replay")
+        self.tracer = None
+        if trace_mode == "record":
+            self.tracer = TraceRecorder(trace_path)
+        elif trace_mode == "replay":
+            self.tracer = TraceReplayer(trace_path, replay_speed)
+        if self.tracer is not None:
+            self.tracer.install(self.tokens.session)
+            self.tracer.install(self.reseller_session)
+
+    def close(self):
+        """Close the pooled sessions and their connections."""
+        self.reseller_session.close()
+        self.tokens.release()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if isinstance(self.tracer, TraceRecorder):
+            self.tracer.close()
+
+    @staticmethod
+    def _timed(key, task):
+        """Run a task and print how long it took."""
+        started = time.perf_counter()
+        try:
+            return task()
+        finally:
+            print(f"DEBUG: Task {key} took {time.perf_counter() - started:.3f}s")
+
+    def _run_concurrently(self, tasks, deadline=None, timed=False):
+        """Run a dict of {key: callable} in parallel.
+        Returns {key: result}; keys that failed or missed the deadline map to None.
+        With timed, the duration of every task is printed.
+        """
+        # Make sure a valid token exists before the workers need it
+        self.get_access_token()
+
+        if timed:
+            tasks = {key: (lambda key=key, task=task: self._timed(key, task)) for key, task in tasks.items()}
+        futures = {key: self.executor.submit(task) for key, task in tasks.items()}
+        wait(futures.values(), timeout=deadline)
+
+        results = {}
+        for key, future in futures.items():
+            if not future.done():
+                future.cancel()
+                print(f"DEBUG: Task {key} missed the deadline of {deadline}s")
+                results[key] = None
+            elif future.exception() is not None:
+                print(f"DEBUG: Task {key} failed: {future.exception()}")
+                results[key] = None
+            else:
+                results[key] = future.result()
+        return results
+
+    @property
+    def access_token(self):
+        return self.tokens.access_token
+
+    def authenticate(self):
+        """Authenticate and retrieve the initial access token."""
+        self.tokens.authenticate()
+
+    def refresh_access_token(self):
+        """Refresh the access token using the refresh token."""
+        self.tokens.refresh_access_token()
 
     def get_access_token(self):
         """Get a valid access token, refreshing it if necessary."""
-        if time.time() >= self.token_expiry:
-            self.refresh_access_token()
-        return self.access_token
+        return self.tokens.get_access_token()
+
+    def _get_json(self, url, ttl):
+        """GET a reseller API URL and return the decoded JSON, served from the response cache if possible.
+        The returned data is shared between callers and must not be modified.
+        """
+        def load():
+            token = self.get_access_token()
+            response = self.reseller_session.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=self.timeout)
+            if response.status_code == 401:
+                # Token was revoked or expired early, renew it once and retry
+                token = self.tokens.invalidate(token)
+                response = self.reseller_session.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=self.timeout)
+            response.raise_for_status()
+            # The decoded objects are cached, which take several times the size of the response body
+            data = response.json()
+            return data, object_size(data)
+
+        return self.cache.get_or_load(url, load, ttl)
+
+    @classmethod
+    def _closed_day_ttl(cls, last_date):
+        """TTL for data up to last_date: closed days never change, today's data does."""
+        return None if str(last_date) < time.strftime("%Y-%m-%d") else cls.OPEN_DAY_TTL
+
+    def cache_stats(self):
+        """Return the response cache counters (hits, misses, coalesced, evictions, entries, bytes)."""
+        return self.cache.stats()
 
     def get_disaggregation_results(self, sensor_id, date):
         """Retrieve disaggregation results for a sensor on a specific date."""
-        url = f"https://reseller-api.voltaware.com/sensors/{sensor_id}/disag/day?date={date}"
-        
-        headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        url = f"{self.reseller_url}/sensors/{sensor_id}/disag/day?date={date}"
+        return self._get_json(url, self._closed_day_ttl(date))
 
     def get_live_power(self, sensor_id):
         """Retrieve live power data for a sensor."""
-        url = f"https://reseller-api.voltaware.com/sensors/{sensor_id}/stats/live"
-        if not self.access_token:
-            self.authenticate()
-        headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        live_power = response.json()
+        url = f"{self.reseller_url}/sensors/{sensor_id}/stats/live"
+        live_power = self._get_json(url, self.LIVE_TTL)
         
         # Extract consumption actualRaw value from nested structure
         consumption_raw = live_power.get("consumption", {}).get("actualRaw", 0)
         return consumption_raw
-    
-    def usage_per_day(self, sensor_id, start_date, end_date):
-        """Retrieve consumption data for a specific period.
-        Returns a list of dicts with 'date' and 'consumption' entries from dailyMetrics.
+
+    def get_live_power_many(self, sensor_ids, deadline=8):
+        """Retrieve live power for several sensors in parallel.
+        Returns a dict keyed by sensor id; sensors that failed or missed the deadline are None.
         """
-        url = f"https://reseller-api.voltaware.com/sensors/{sensor_id}/stats/period?from={start_date}&to={end_date}"
-        
-        if not self.access_token:
-            self.authenticate() # Ensure we have an access token before making the request
-        headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Use 'dailyMetrics' from the response
-        result = []
-        for entry in data.get("dailyMetrics", []):
-            
-            result.append({
-                "date": entry.get("date"),
-                "consumption": entry.get("consumption")
-            })
-        print("ok1 -> ", result)
-        return result
-
-def get_day_with_max_consumption(daily_data):
-    """Returns the entry (dict) with the maximum consumption."""
-    if not daily_data:
-        return None
-    return max(daily_data, key=lambda x: x.get("consumption", 0))
-
-def get_day_with_min_consumption(daily_data):
-    """Returns the entry (dict) with the minimum consumption."""
-    if not daily_data:
-        return None
-    return min(daily_data, key=lambda x: x.get("consumption", float("inf")))
-
-def get_mean_consumption(daily_data):
-    """Returns the mean consumption over all days."""
-    if not daily_data:
-        return 0
-    total = sum(x.get("consumption", 0) for x in daily_data)
-    return total / len(daily_data)
-
-def get_sum_consumption(daily_data):
-    """Returns the sum of consumption over all days."""
-    if not daily_data:
-        return 0
-    return sum(x.get("consumption", 0) for x in  daily_data)
+        tasks = {sensor_id: (lambda sensor_id=sensor_id: self.get_live_power(sensor_id)) for sensor_id in sensor_ids}
+        return self._run_concurrently(tasks, deadline)
 
+    def _fetch_daily_metrics(self, sensor_id, start_date, end_date):
+        """Retrieve the 'dailyMetrics' entries ('date' and 'consumption') for a specific period from the API.
+        The entries are shared with the response cache and must not be modified.
+        """
+        url = f"{self.reseller_url}/sensors/{sensor_id}/stats/period?from={start_date}&to={end_date}"
+        data = self._get_json(url, self._closed_day_ttl(end_date))
+        return data.get("dailyMetrics", [])
+
+    def usage_series(self, sensor_id, start_date, end_date):
+        """Retrieve consumption data for a specific period as a DailySeries (values in Wh).
+        The series is built straight from the API's dailyMetrics entries. With a store, only the
+        dates missing from it are fetched from the API.
+        """
+        if self.store is None:
+            return DailySeries.from_records(self._fetch_daily_metrics(sensor_id, start_date, end_date))
+
+        stored = self.store.get(sensor_id, start_date, end_date)
+        stored_dates = {day["date"] for day in stored}
+        missing = [d for d in date_range(start_date, end_date) if d not in stored_dates]
+        if not missing:
+            return DailySeries.from_records(stored)
 
+        # Fetch each run of consecutive missing dates and keep the closed days. An old gap the API has
+        # no data for only costs a request for the gap itself, not for everything after it.
+        fetched = []
+        for first, last in date_runs(missing):
+            fetched.extend(self._fetch_daily_metrics(sensor_id, first, last))
+        self.store.put(sensor_id, fetched)
+        print(f"DEBUG: Fetched {len(fetched)} days for {sensor_id}, {len(missing)} were missing from the store")
+
+        records = stored + [entry for entry in fetched if entry.get("date", "")[:10] not in stored_dates]
+        return DailySeries.from_records(sorted(records, key=lambda r: r["date"]))
+
+    def usage_series_many(self, queries, deadline=None):
+        """Retrieve DailySeries for several (sensor_id, start_date, end_date) queries in parallel.
+        Returns a dict keyed by the query tuple; failed queries are None.
+        """
+        tasks = {query: (lambda query=query: self.usage_series(*query)) for query in queries}
+        return self._run_concurrently(tasks, deadline, timed=True)
 
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
 
+def shared_api_client(settings, with_store=False):
+    """Return the process-wide APIClient for a dashboard's settings (st.secrets or a dict), creating it on first use.
+    settings holds client_id and client_secret, and optionally base_url and reseller_url (e.g. to run against
+    mock_server.py) and trace_mode ("record" or "replay"), trace_path and replay_speed.
+    With with_store, closed days are kept in a DailyMetricsStore; a replay gets an in-memory one, so recorded
+    data never mixes with data stored from the real API.
+    """
+    options = dict(
+        base_url=settings.get("base_url"),
+        reseller_url=settings.get("reseller_url"),
+        trace_mode=settings.get("trace_mode"),
+        trace_path=settings.get("trace_path", "api_trace.jsonl.gz"),
+        replay_speed=float(settings.get("replay_speed", 1.0)),
+    )
+    key = (settings["client_id"], with_store) + tuple(options.values())
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            print("DEBUG: Creating shared API client...")
+            store = None
+            if with_store:
+                store = DailyMetricsStore(":memory:") if options["trace_mode"] == "replay" else DailyMetricsStore()
+            _shared_clients[key] = APIClient(settings["client_id"], settings["client_secret"], store=store, **options)
+        return _shared_clients[key]
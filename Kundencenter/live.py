@@ -0,0 +1,268 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from store import TOTAL_ID
+
+class CircuitBreaker:
+    """Tracks consecutive failures of one sensor and spaces out retries with exponential backoff.
+    After failure_threshold failures in a row the circuit is open and the sensor is only retried
+    once the backoff delay has passed (half-open); a success closes it again.
+    """
+
+    def __init__(self, failure_threshold=3, base_delay=10, max_delay=300):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self.retry_at = 0
+
+    def allow(self, now=None):
+        """Return True if a request may be made now."""
+        return (time.time() if now is None else now) >= self.retry_at
+
+    def record_success(self):
+        self.failures = 0
+        self.retry_at = 0
+
+    def record_failure(self, now=None):
+        now = time.time() if now is None else now
+        self.failures += 1
+        # Below the threshold the sensor keeps being polled on every round
+        if self.failures >= self.failure_threshold:
+            backoff = 2 ** (self.failures - self.failure_threshold)
+            self.retry_at = now + min(self.max_delay, self.base_delay * backoff)
+
+    @property
+    def state(self):
+        if self.failures < self.failure_threshold:
+            return "closed"
+        return "half-open" if self.allow() else "open"
+
+class LiveBuffer:
+    """Fixed-capacity ring buffer of (timestamp, kW) live samples in preallocated NumPy arrays.
+    Every sample is written twice, at its slot and capacity slots later, so the last n samples are
+    always one contiguous slice: appends are O(1) and windows are views without copying.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity)
+        self.values = np.zeros(2 * capacity)
+        self.head = 0  # Slot of the next sample
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, value):
+        for slot in (self.head, self.head + self.capacity):
+            self.timestamps[slot] = timestamp
+            self.values[slot] = value
+        # Published after the data is written, so readers never see an unwritten slot
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def window(self, seconds=None, now=None):
+        """Return (timestamps, values) views of the samples of the last `seconds` (all samples if None), oldest first."""
+        end = self.head + self.capacity
+        start = end - self.count
+        timestamps = self.timestamps[start:end]
+        if seconds is not None:
+            cutoff = (time.time() if now is None else now) - seconds
+            start += int(np.searchsorted(timestamps, cutoff, side="left"))
+        return self.timestamps[start:end], self.values[start:end]
+
+    def latest(self):
+        """Return the newest (timestamp, value), or None if the buffer is empty."""
+        if not self.count:
+            return None
+        slot = self.head - 1 + self.capacity
+        return float(self.timestamps[slot]), float(self.values[slot])
+
+    def mean(self, seconds=None, now=None):
+        """Return the average of the samples of the last `seconds`, or None if there are none."""
+        _, values = self.window(seconds, now)
+        return float(values.mean()) if len(values) else None
+
+def _local_day(timestamp):
+    """Return the local date of a timestamp as YYYY-MM-DD and the timestamp of the following midnight."""
+    day = datetime.fromtimestamp(timestamp).date()
+    next_midnight = datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+    return day.strftime("%Y-%m-%d"), next_midnight
+
+class EnergyIntegrator:
+    """Integrates live power samples (kW) into energy (kWh) for the current local day, per key.
+    Consecutive samples are joined by the trapezoidal rule; gaps longer than max_gap are not bridged
+    and only reduce the coverage. A sample pair spanning midnight is split at midnight.
+    Closed days are kept until they are reconciled against the daily value from the API, which
+    updates a per-key correction factor applied to the running estimate.
+    """
+
+    def __init__(self, max_gap=60, min_coverage=0.8, correction_weight=0.5):
+        self.max_gap = max_gap
+        self.min_coverage = min_coverage
+        self.correction_weight = correction_weight
+        self.lock = threading.Lock()
+        # key -> {"date", "next_midnight", "kwh", "covered", "last": (timestamp, kw) or None}
+        self.days = {}
+        # (key, date) -> (kwh, covered seconds) of days closed but not reconciled yet
+        self.closed = {}
+        self.corrections = {}
+
+    def add(self, key, timestamp, kw):
+        """Add one sample; samples must arrive in time order per key."""
+        with self.lock:
+            day = self.days.get(key)
+            if day is None:
+                day = self.days[key] = self._new_day(timestamp)
+            last = day["last"]
+            if last is not None and timestamp >= day["next_midnight"]:
+                # Split the last interval at midnight, interpolating the power there
+                midnight = day["next_midnight"]
+                if timestamp - last[0] <= self.max_gap:
+                    kw_midnight = last[1] + (kw - last[1]) * (midnight - last[0]) / (timestamp - last[0])
+                    self._integrate(day, last, (midnight, kw_midnight))
+                    last = (midnight, kw_midnight)
+                else:
+                    last = None
+                self.closed[(key, day["date"])] = (day["kwh"], day["covered"])
+                day = self.days[key] = self._new_day(timestamp)
+            if last is not None:
+                self._integrate(day, last, (timestamp, kw))
+            day["last"] = (timestamp, kw)
+
+    def _new_day(self, timestamp):
+        date, next_midnight = _local_day(timestamp)
+        return {"date": date, "next_midnight": next_midnight, "kwh": 0.0, "covered": 0.0, "last": None}
+
+    def _integrate(self, day, start, end):
+        dt = end[0] - start[0]
+        if 0 < dt <= self.max_gap:
+            day["kwh"] += (start[1] + end[1]) / 2 * dt / 3600
+            day["covered"] += dt
+
+    def today(self, key, now=None):
+        """Return the corrected energy of the current local day so far in kWh (0 if there are no samples yet)."""
+        date, _ = _local_day(time.time() if now is None else now)
+        with self.lock:
+            day = self.days.get(key)
+            if day is None or day["date"] != date:
+                return 0.0
+            return day["kwh"] * self.corrections.get(key, 1.0)
+
+    def pending(self):
+        """Return the (key, date) pairs of closed days waiting for reconciliation."""
+        with self.lock:
+            return list(self.closed)
+
+    def reconcile(self, key, date, actual_kwh):
+        """Compare a closed day with the API value and update the key's correction factor.
+        Returns the relative error of the uncorrected estimate, or None if the day is unknown, has too
+        little coverage or the actual value is missing. Each day is reconciled at most once.
+        """
+        with self.lock:
+            estimate = self.closed.pop((key, date), None)
+            if estimate is None or actual_kwh is None or not estimate[0] > 0:
+                return None
+            kwh, covered = estimate
+            if covered < self.min_coverage * 24 * 3600:
+                return None
+            factor = actual_kwh / kwh
+            previous = self.corrections.get(key, factor)
+            self.corrections[key] = previous + self.correction_weight * (factor - previous)
+            return kwh / actual_kwh - 1
+
+class LivePoller:
+    """Polls live power for all sensors on a fixed cadence in one background thread.
+    Every poll publishes a new snapshot; dashboard sessions only read the latest snapshot,
+    so the API traffic does not depend on the number of open dashboards.
+    Fresh samples (kW) are also kept per sensor and for the total (TOTAL_ID) in LiveBuffers of history_secs,
+    and appended to sample_log (a LiveSampleLog) if one is given. The integrator turns them into
+    today's energy per sensor.
+    """
+    def __init__(self, api_client, sensor_ids, interval=10, deadline=8, history_secs=24 * 3600, sample_log=None):
+        self.api_client = api_client
+        self.sensor_ids = list(sensor_ids)
+        self.interval = interval
+        self.deadline = deadline
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.breakers = {sensor_id: CircuitBreaker(base_delay=interval) for sensor_id in self.sensor_ids}
+        # Last good value per sensor as (watts, timestamp), kept while the sensor fails
+        self.last_good = {}
+        capacity = max(1, int(history_secs // interval))
+        self.history = {key: LiveBuffer(capacity) for key in self.sensor_ids + [TOTAL_ID]}
+        self.sample_log = sample_log
+        self.integrator = EnergyIntegrator(max_gap=6 * interval)
+        # Replaced as a whole on every poll, so readers never see a half-written snapshot
+        self._snapshot = {"version": 0, "timestamp": 0, "values": {}, "updated": {}}
+
+    def start(self):
+        """Start the background thread (no-op if it is already running)."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="live-poller", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background thread after the current poll."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def snapshot(self):
+        """Return the latest snapshot.
+        "values" maps each sensor id to its last good live power in watts (None if there never was one)
+        and "updated" to the time that value was fetched, so stale values can be shown with their age.
+        """
+        return self._snapshot
+
+    def poll_once(self):
+        """Fetch live power for all sensors whose circuit allows it and publish a new snapshot."""
+        now = time.time()
+        due = [sensor_id for sensor_id in self.sensor_ids if self.breakers[sensor_id].allow(now)]
+        try:
+            values = self.api_client.get_live_power_many(due, deadline=self.deadline) if due else {}
+        except Exception as e:
+            print(f"DEBUG: Live poll failed: {e}")
+            values = {sensor_id: None for sensor_id in due}
+
+        now = time.time()
+        for sensor_id in due:
+            breaker = self.breakers[sensor_id]
+            if values.get(sensor_id) is None:
+                breaker.record_failure(now)
+                print(f"DEBUG: Live poll for {sensor_id} failed {breaker.failures}x, circuit {breaker.state}")
+            else:
+                breaker.record_success()
+                self.last_good[sensor_id] = (values[sensor_id], now)
+                self.history[sensor_id].append(now, values[sensor_id] / 1000)
+                self.integrator.add(sensor_id, now, values[sensor_id] / 1000)
+                if self.sample_log is not None:
+                    try:
+                        self.sample_log.append(sensor_id, now, values[sensor_id] / 1000)
+                    except OSError as e:
+                        print(f"DEBUG: Could not log live sample for {sensor_id}: {e}")
+
+        # The total is sampled from the last good values, so a single failing sensor does not drop it
+        if self.last_good:
+            self.history[TOTAL_ID].append(now, sum(watts for watts, _ in self.last_good.values()) / 1000)
+
+        self._snapshot = {
+            "version": self._snapshot["version"] + 1,
+            "timestamp": now,
+            "values": {sensor_id: self.last_good.get(sensor_id, (None, None))[0] for sensor_id in self.sensor_ids},
+            "updated": {sensor_id: self.last_good.get(sensor_id, (None, None))[1] for sensor_id in self.sensor_ids},
+        }
+        return self._snapshot
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            self.poll_once()
+            # Keep a fixed cadence regardless of how long the poll took
+            self.stop_event.wait(max(0, self.interval - (time.monotonic() - started)))
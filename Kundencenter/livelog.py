@@ -0,0 +1,111 @@
+"""Append-only binary log of live power samples, one file per sensor and day.
+
+Records are fixed-width (timestamp as float64, kW as float32), so a day file can be memory-mapped
+as a NumPy structured array and analyzed without loading the whole log into memory.
+
+Summarize logged days (peak, base load, night consumption):
+    python livelog.py summary --sensor 22018 --from 2025-01-01 --to 2025-01-31
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([("timestamp", "<f8"), ("kw", "<f4")])
+
+class LiveSampleLog:
+    """Appends live samples to <directory>/<sensor_id>/<YYYY-MM-DD>.bin (local date of the sample).
+    Files are rotated when a sample falls on a new day; old days are never modified again.
+    """
+    DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "live_samples")
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        # sensor_id -> (date, open file)
+        self.files = {}
+
+    def path(self, sensor_id, date):
+        return os.path.join(self.directory, str(sensor_id), f"{date}.bin")
+
+    def append(self, sensor_id, timestamp, kw):
+        """Append one sample."""
+        date = time.strftime("%Y-%m-%d", time.localtime(timestamp))
+        record = np.array([(timestamp, kw)], dtype=RECORD_DTYPE).tobytes()
+        with self.lock:
+            current = self.files.get(sensor_id)
+            if current is None or current[0] != date:
+                if current is not None:
+                    current[1].close()
+                os.makedirs(os.path.dirname(self.path(sensor_id, date)), exist_ok=True)
+                current = (date, open(self.path(sensor_id, date), "ab"))
+                self.files[sensor_id] = current
+            current[1].write(record)
+            current[1].flush()
+
+    def read(self, sensor_id, date):
+        """Return the samples of one day as a read-only memory-mapped structured array (empty if none)."""
+        path = self.path(sensor_id, date)
+        # A torn last record (e.g. after a crash while writing) is ignored
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+        if not count:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+    def days(self, sensor_id, start_date=None, end_date=None):
+        """Return the logged dates of a sensor between start_date and end_date (inclusive), oldest first."""
+        directory = os.path.join(self.directory, str(sensor_id))
+        if not os.path.isdir(directory):
+            return []
+        dates = sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".bin"))
+        return [d for d in dates if (start_date is None or d >= start_date) and (end_date is None or d <= end_date)]
+
+    def close(self):
+        with self.lock:
+            for _, f in self.files.values():
+                f.close()
+            self.files.clear()
+
+def summarize_day(samples, night_hours=(0, 5)):
+    """Return peak, base load (5th percentile) and mean night power in kW for one day of samples."""
+    if not len(samples):
+        return None
+    kw = samples["kw"]
+    # Hours since local midnight, vectorized instead of one datetime per sample
+    midnight = time.mktime(datetime.fromtimestamp(samples["timestamp"][0]).date().timetuple())
+    sample_hours = (samples["timestamp"] - midnight) / 3600
+    night = kw[(sample_hours >= night_hours[0]) & (sample_hours < night_hours[1])]
+    peak = int(np.argmax(kw))
+    return {
+        "samples": len(kw),
+        "peak_kw": float(kw[peak]),
+        "peak_at": datetime.fromtimestamp(samples["timestamp"][peak]).strftime("%H:%M:%S"),
+        "base_kw": float(np.percentile(kw, 5)),
+        "night_kw": float(night.mean()) if len(night) else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("--sensor", required=True)
+    parser.add_argument("--from", dest="start_date", default=None)
+    parser.add_argument("--to", dest="end_date", default=None)
+    parser.add_argument("--directory", default=LiveSampleLog.DEFAULT_DIR)
+    args = parser.parse_args()
+
+    log = LiveSampleLog(args.directory)
+    for date in log.days(args.sensor, args.start_date, args.end_date):
+        summary = summarize_day(log.read(args.sensor, date))
+        if summary is None:
+            continue
+        night = "-" if summary["night_kw"] is None else f"{summary['night_kw']:.2f}"
+        print(
+            f"{date}: {summary['samples']} samples, peak {summary['peak_kw']:.2f} kW at {summary['peak_at']}, "
+            f"base {summary['base_kw']:.2f} kW, night {night} kW"
+        )
+
+if __name__ == "__main__":
+    main()
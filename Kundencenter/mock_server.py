@@ -0,0 +1,293 @@
+"""Local stand-in for the Voltaware API with configurable latency, errors, token expiry and rate limits.
+
+Run a server for the dashboards (point base_url/reseller_url in .streamlit/secrets.toml at it):
+    python mock_server.py serve --port 8765 --latency lognormal:0.08,0.5 --error-rate 0.02
+
+Benchmark APIClient live fetching against an in-process server:
+    python mock_server.py bench --sensors 1000 --rounds 5 --latency lognormal:0.08,0.5
+"""
+import argparse
+import hashlib
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DISAG_CATEGORIES = [
+    "air_conditioner", "cooking", "fridge_freezer", "heating", "kettle",
+    "lighting_entertainment", "standby", "others", "boiler",
+]
+
+def parse_latency(spec):
+    """Parse a latency distribution spec into a function returning a delay in seconds.
+    Supported: "fixed:S", "uniform:MIN,MAX", "lognormal:MEDIAN,SIGMA" (all in seconds).
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",")] if args else []
+    if kind == "fixed":
+        return lambda rng: params[0] if params else 0.0
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "lognormal":
+        median, sigma = params
+        return lambda rng: median * rng.lognormvariate(0, sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+def _noise(*parts):
+    """Deterministic value in [0, 1) derived from the given parts."""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+class MockVoltawareServer:
+    """Threaded HTTP server implementing the Voltaware endpoints used by APIClient.
+    Daily and disaggregation values are deterministic per (sensor, date); live values vary over time.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", error_rate=0.0, token_ttl=3600,
+                 rate_limit=None, rate_burst=None, seed=None):
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        # Token bucket shared by all clients; None disables rate limiting
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst or (rate_limit or 0)
+        self.bucket = self.rate_burst
+        self.bucket_updated = time.monotonic()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.access_tokens = {}
+        self.refresh_tokens = set()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "unauthorized": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-voltaware", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    # --- Behaviour ---
+
+    def _take_rate_token(self):
+        """Return True if the request fits into the rate limit."""
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        self.bucket = min(self.rate_burst, self.bucket + (now - self.bucket_updated) * self.rate_limit)
+        self.bucket_updated = now
+        if self.bucket < 1:
+            return False
+        self.bucket -= 1
+        return True
+
+    def _issue_token(self, with_refresh):
+        data = {"access_token": secrets.token_hex(16), "expires_in_secs": self.token_ttl}
+        self.access_tokens[data["access_token"]] = time.time() + self.token_ttl
+        if with_refresh:
+            data["refresh_token"] = secrets.token_hex(16)
+            self.refresh_tokens.add(data["refresh_token"])
+        return data
+
+    def _is_authorized(self, header):
+        token = (header or "").removeprefix("Bearer ")
+        return self.access_tokens.get(token, 0) > time.time()
+
+    def handle(self, method, path, query, headers, body):
+        """Return (status, payload) for one request, after simulated latency and faults."""
+        with self.lock:
+            self.stats["requests"] += 1
+            delay = self.latency(self.rng)
+            failing = self.rng.random() < self.error_rate
+            allowed = self._take_rate_token()
+        time.sleep(max(0.0, delay))
+
+        if not allowed:
+            with self.lock:
+                self.stats["rate_limited"] += 1
+            return 429, {"error": "rate limit exceeded"}
+        if failing:
+            with self.lock:
+                self.stats["errors"] += 1
+            return 503, {"error": "injected failure"}
+
+        parts = [p for p in path.split("/") if p]
+        with self.lock:
+            if method == "POST" and parts == ["auth", "token"]:
+                if body.get("grant_type") != "client_credentials" or not body.get("client_secret"):
+                    return 400, {"error": "invalid credentials"}
+                return 200, self._issue_token(with_refresh=True)
+            if method == "POST" and parts == ["auth", "token", "refresh"]:
+                if body.get("refresh_token") not in self.refresh_tokens:
+                    return 401, {"error": "invalid refresh token"}
+                return 200, self._issue_token(with_refresh=False)
+            authorized = self._is_authorized(headers.get("Authorization"))
+
+        if method != "GET" or len(parts) < 3 or parts[0] != "sensors":
+            return 404, {"error": "not found"}
+        if not authorized:
+            with self.lock:
+                self.stats["unauthorized"] += 1
+            return 401, {"error": "invalid or expired token"}
+
+        sensor_id = parts[1]
+        endpoint = "/".join(parts[2:])
+        if endpoint == "stats/live":
+            return 200, self.live(sensor_id)
+        if endpoint == "stats/period" and "from" in query and "to" in query:
+            return 200, self.period(sensor_id, query["from"][0], query["to"][0])
+        if endpoint == "disag/day" and "date" in query:
+            return 200, self.disaggregation(sensor_id, query["date"][0])
+        return 404, {"error": "not found"}
+
+    def live(self, sensor_id):
+        base = 2000 + 8000 * _noise(sensor_id, "base")
+        watts = base * (0.6 + 0.8 * _noise(sensor_id, int(time.time() // 10)))
+        return {"consumption": {"actualRaw": round(watts, 1)}}
+
+    def period(self, sensor_id, start_date, end_date):
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        metrics = []
+        day = start
+        while day <= end:
+            date = day.strftime("%Y-%m-%d")
+            metrics.append({"date": date, "consumption": round(50000 + 150000 * _noise(sensor_id, date), 1)})
+            day += timedelta(days=1)
+        return {"dailyMetrics": metrics}
+
+    def disaggregation(self, sensor_id, date):
+        return {"consumption": {c: round(10000 * _noise(sensor_id, date, c), 1) for c in DISAG_CATEGORIES}}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                status, payload = server.handle(method, url.path, parse_qs(url.query), self.headers, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def benchmark(sensors=6, rounds=5, pool_size=32, deadline=8, **server_options):
+    """Fetch live power for `sensors` sensors `rounds` times against an in-process mock server.
+    Returns throughput and per-request latency percentiles.
+    """
+    from functions import APIClient
+
+    server = MockVoltawareServer(**server_options).start()
+    api = APIClient("bench", "bench", pool_size=pool_size, cache_max_bytes=0, base_url=server.url, reseller_url=server.url)
+    sensor_ids = [str(20000 + i) for i in range(sensors)]
+
+    latencies = []
+    fetch = api.get_live_power
+
+    def timed_fetch(sensor_id):
+        started = time.perf_counter()
+        try:
+            return fetch(sensor_id)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    api.get_live_power = timed_fetch
+    round_times = []
+    missing = 0
+    try:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            results = api.get_live_power_many(sensor_ids, deadline=deadline)
+            round_times.append(time.perf_counter() - started)
+            missing += sum(1 for v in results.values() if v is None)
+    finally:
+        api.close()
+        server.stop()
+
+    latencies.sort()
+    total = sum(round_times)
+    return {
+        "sensors": sensors,
+        "rounds": rounds,
+        "requests_per_sec": sensors * rounds / total if total else float("nan"),
+        "round_p50": sorted(round_times)[len(round_times) // 2],
+        "round_max": max(round_times),
+        "latency_p50": _percentile(latencies, 0.50),
+        "latency_p95": _percentile(latencies, 0.95),
+        "latency_p99": _percentile(latencies, 0.99),
+        "missing": missing,
+        "server": server.stats,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["serve", "bench"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=int, default=3600)
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests per second")
+    parser.add_argument("--rate-burst", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sensors", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--pool-size", type=int, default=32)
+    args = parser.parse_args()
+
+    server_options = dict(
+        latency=args.latency, error_rate=args.error_rate, token_ttl=args.token_ttl,
+        rate_limit=args.rate_limit, rate_burst=args.rate_burst, seed=args.seed,
+    )
+    if args.command == "serve":
+        server = MockVoltawareServer(host=args.host, port=args.port, **server_options)
+        print(f"Mock Voltaware API listening on {server.url}")
+        server.serve_forever()
+    else:
+        result = benchmark(args.sensors, args.rounds, args.pool_size, **server_options)
+        for key, value in result.items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+
+if __name__ == "__main__":
+    main()
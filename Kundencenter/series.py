@@ -0,0 +1,396 @@
+import math
+from collections import deque, namedtuple
+
+import numpy as np
+
+from store import TOTAL_ID, date_runs
+
+SeriesStats = namedtuple("SeriesStats", ["sum", "mean", "min", "argmin", "max", "argmax"])
+
+class DailySeries:
+    """Daily values stored as two NumPy columns: dates (datetime64[D]) and values (float64).
+    Missing values are NaN and are ignored by the statistics.
+    """
+    __slots__ = ("dates", "values")
+
+    def __init__(self, dates, values):
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.values = np.asarray(values, dtype=np.float64)
+
+    @classmethod
+    def from_records(cls, records, value_key="consumption"):
+        """Build a series from dicts with 'date' and value_key entries (e.g. the API's dailyMetrics)."""
+        n = len(records)
+        dates = np.fromiter((r["date"][:10] for r in records), dtype="datetime64[D]", count=n)
+        values = np.fromiter(
+            (np.nan if r.get(value_key) is None else r[value_key] for r in records), dtype=np.float64, count=n
+        )
+        return cls(dates, values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def scaled(self, factor):
+        """Return a copy with all values multiplied by factor, e.g. 1/1000 for Wh -> kWh."""
+        return DailySeries(self.dates, self.values * factor)
+
+    def between(self, start_date, end_date):
+        """Return the days between start_date and end_date (inclusive). Dates must be sorted."""
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, "D"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(end_date, "D"), side="right")
+        return DailySeries(self.dates[lo:hi], self.values[lo:hi])
+
+    def stats(self):
+        """Return sum, mean, min, argmin, max and argmax in one call, ignoring missing days.
+        For a series without values, all numbers are 0 and the arg positions are -1.
+        """
+        valid = ~np.isnan(self.values)
+        if not valid.any():
+            return SeriesStats(0.0, 0.0, 0.0, -1, 0.0, -1)
+        total = float(self.values[valid].sum())
+        argmin = int(np.nanargmin(self.values))
+        argmax = int(np.nanargmax(self.values))
+        return SeriesStats(
+            total, total / int(valid.sum()), float(self.values[argmin]), argmin, float(self.values[argmax]), argmax
+        )
+
+    def day(self, i):
+        """Return the day at position i as a {'date', 'consumption'} dict, as used by the dashboards."""
+        if not 0 <= i < len(self.values):
+            return {"date": "-", "consumption": 0}
+        return {"date": str(self.dates[i]), "consumption": float(self.values[i])}
+
+class SensorDayMatrix:
+    """Sensors x days matrix of daily values on one shared date index (NaN where a sensor has no value).
+    Rows are aligned by date, so totals stay correct when sensors have gaps or different days.
+    """
+
+    def __init__(self, sensor_ids, dates, values):
+        self.sensor_ids = list(sensor_ids)
+        self.index = {sensor_id: i for i, sensor_id in enumerate(self.sensor_ids)}
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.values = np.asarray(values, dtype=np.float64)
+
+    @classmethod
+    def from_series(cls, series_by_sensor, start_date, end_date):
+        """Build the matrix for all days between start_date and end_date (inclusive) from
+        {sensor_id: DailySeries}. Days outside the range are dropped; None counts as no data.
+        """
+        start = np.datetime64(start_date, "D")
+        dates = np.arange(start, np.datetime64(end_date, "D") + 1)
+        values = np.full((len(series_by_sensor), len(dates)), np.nan)
+        for row, series in enumerate(series_by_sensor.values()):
+            if series is None or not len(series):
+                continue
+            cols = (series.dates - start).astype(np.int64)
+            inside = (cols >= 0) & (cols < len(dates))
+            values[row, cols[inside]] = series.values[inside]
+        return cls(series_by_sensor.keys(), dates, values)
+
+    def between(self, start_date, end_date):
+        """Return the sub-matrix for the days between start_date and end_date (inclusive)."""
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, "D"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(end_date, "D"), side="right")
+        return SensorDayMatrix(self.sensor_ids, self.dates[lo:hi], self.values[:, lo:hi])
+
+    def row(self, sensor_id):
+        """Return the days of one sensor as a DailySeries (sharing the matrix memory)."""
+        return DailySeries(self.dates, self.values[self.index[sensor_id]])
+
+    def coverage(self):
+        """Return a sensors x days boolean mask of which values are present."""
+        return ~np.isnan(self.values)
+
+    def day_coverage(self):
+        """Return the number of sensors with a value for each day."""
+        return self.coverage().sum(axis=0)
+
+    def totals(self):
+        """Return the sum over all sensors per day as a DailySeries; days without any value are NaN."""
+        covered = self.day_coverage() > 0
+        totals = np.where(covered, np.nansum(self.values, axis=0), np.nan)
+        return DailySeries(self.dates, totals)
+
+class RollingWindow:
+    """Window over the last `size` daily values, updated one day at a time.
+    The sum is kept up to date in O(1); the other statistics come from to_series().stats().
+    NaN days count towards the window length but are ignored by the sum.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.days = deque()
+        self.total = 0.0
+        self.count = 0
+
+    @classmethod
+    def from_series(cls, series, size):
+        window = cls(size)
+        for date, value in zip(series.dates, series.values):
+            window.push(date, value)
+        return window
+
+    def push(self, date, value):
+        """Append the newest day. Returns the evicted (date, value), or None while the window fills up."""
+        date = np.datetime64(date, "D")
+        value = float(value)
+        self.days.append((date, value))
+        if not math.isnan(value):
+            self.total += value
+            self.count += 1
+
+        if len(self.days) <= self.size:
+            return None
+        evicted = self.days.popleft()
+        if not math.isnan(evicted[1]):
+            self.total -= evicted[1]
+            self.count -= 1
+        return evicted
+
+    @property
+    def last_date(self):
+        return self.days[-1][0] if self.days else None
+
+    def get(self, date):
+        """Return the value of a day in the window, or None if the day is not in it."""
+        date = np.datetime64(date, "D")
+        for d, value in self.days:
+            if d == date:
+                return value
+        return None
+
+    def replace(self, date, value):
+        """Replace the value of a day in the window. Returns False if the day is not in it."""
+        date = np.datetime64(date, "D")
+        value = float(value)
+        for i, (d, old) in enumerate(self.days):
+            if d != date:
+                continue
+            if not math.isnan(old):
+                self.total -= old
+                self.count -= 1
+            if not math.isnan(value):
+                self.total += value
+                self.count += 1
+            self.days[i] = (d, value)
+            return True
+        return False
+
+    @property
+    def sum(self):
+        # Repeated add/subtract accumulates rounding error, which is irrelevant at kWh precision
+        return self.total if self.count else 0.0
+
+    def to_series(self):
+        return DailySeries([d for d, _ in self.days], [v for _, v in self.days])
+
+class WindowAggregator:
+    """Rolling windows for the current period and the comparison period before it, per sensor and
+    for the total over all sensors (TOTAL_ID). Advancing by one day pushes the new day into the current
+    window and the day it evicts into the comparison window.
+    """
+
+    def __init__(self, sensor_ids, period_days, comparison_days):
+        self.sensor_ids = list(sensor_ids)
+        keys = self.sensor_ids + [TOTAL_ID]
+        self.current = {key: RollingWindow(period_days) for key in keys}
+        self.previous = {key: RollingWindow(comparison_days) for key in keys}
+        # Number of times each incomplete date was fetched again (see update_windows)
+        self.refetches = {}
+
+    @classmethod
+    def from_matrix(cls, matrix, period_days, comparison_days):
+        """Build the windows from a SensorDayMatrix covering both periods, oldest day first."""
+        aggregator = cls(matrix.sensor_ids, period_days, comparison_days)
+        totals = matrix.totals().values
+        for i, date in enumerate(matrix.dates):
+            aggregator.advance(date, dict(zip(matrix.sensor_ids, matrix.values[:, i])), totals[i])
+        return aggregator
+
+    @property
+    def last_date(self):
+        return self.current[TOTAL_ID].last_date
+
+    def incomplete_dates(self):
+        """Return the dates in both windows on which at least one sensor has no value, oldest first."""
+        dates = set()
+        for sensor_id in self.sensor_ids:
+            for window in (self.previous[sensor_id], self.current[sensor_id]):
+                dates.update(date for date, value in window.days if math.isnan(value))
+        return sorted(dates)
+
+    def patch(self, date, values_by_sensor):
+        """Fill in the values a sensor was missing on a day that is already in the windows, and
+        recompute the day's total. NaN values leave the day of that sensor as it is.
+        """
+        present = []
+        for sensor_id in self.sensor_ids:
+            value = values_by_sensor.get(sensor_id, np.nan)
+            for window in (self.current[sensor_id], self.previous[sensor_id]):
+                if value is not None and not math.isnan(value):
+                    window.replace(date, value)
+                stored = window.get(date)
+                if stored is not None and not math.isnan(stored):
+                    present.append(stored)
+        total = sum(present) if present else np.nan
+        for window in (self.current[TOTAL_ID], self.previous[TOTAL_ID]):
+            window.replace(date, total)
+
+    def advance(self, date, values_by_sensor, total=None):
+        """Add one day. values_by_sensor maps sensor ids to the day's value (missing = NaN).
+        The total defaults to the sum of the available values (NaN if there are none).
+        """
+        values = [values_by_sensor.get(sensor_id, np.nan) for sensor_id in self.sensor_ids]
+        if total is None:
+            present = [v for v in values if v is not None and not math.isnan(v)]
+            total = sum(present) if present else np.nan
+        for key, value in zip(self.sensor_ids + [TOTAL_ID], values + [total]):
+            evicted = self.current[key].push(date, np.nan if value is None else value)
+            if evicted is not None:
+                self.previous[key].push(*evicted)
+
+def update_windows(windows, end_date, period_days, comparison_days, fetch_matrix, max_refetches=3):
+    """Bring the windows (None on first use) up to end_date and return them.
+    fetch_matrix(start_date, end_date) returns the SensorDayMatrix of those days. After a day rollover
+    only the new days are fetched and pushed into the windows; the full window is only fetched on
+    first use or after a longer gap. Days with missing sensor data (e.g. from a failed fetch) are
+    fetched again and patched in on each update, up to max_refetches times per day, so a sensor with
+    a permanent gap does not cost more than that.
+    """
+    end = np.datetime64(end_date, "D")
+    days_behind = None
+    if windows is not None and windows.last_date is not None:
+        days_behind = int((end - windows.last_date).astype(int))
+
+    if days_behind is not None and 0 <= days_behind <= period_days:
+        refetch_incomplete_dates(windows, fetch_matrix, max_refetches)
+
+    if days_behind == 0:
+        print("DEBUG: History windows are up to date")
+    elif days_behind is not None and 0 < days_behind <= period_days:
+        next_date = str(windows.last_date + 1)
+        print(f"DEBUG: Advancing history windows by {days_behind} day(s) from {next_date}")
+        matrix = fetch_matrix(next_date, str(end))
+        totals = matrix.totals().values
+        for i, date in enumerate(matrix.dates):
+            windows.advance(date, dict(zip(matrix.sensor_ids, matrix.values[:, i])), totals[i])
+    else:
+        start = str(end - (period_days + comparison_days - 1))
+        print(f"DEBUG: Building history windows from {start} to {end}")
+        windows = WindowAggregator.from_matrix(fetch_matrix(start, str(end)), period_days, comparison_days)
+    return windows
+
+def refetch_incomplete_dates(windows, fetch_matrix, max_refetches):
+    """Fetch the days with missing sensor data again, one request per run of consecutive days, and patch them in."""
+    incomplete = windows.incomplete_dates()
+    windows.refetches = {d: n for d, n in windows.refetches.items() if d in incomplete}
+    due = [d for d in incomplete if windows.refetches.get(d, 0) < max_refetches]
+    if not due:
+        return
+    print(f"DEBUG: Fetching {len(due)} history day(s) with missing sensor data again")
+    for first, last in date_runs([str(d) for d in due]):
+        matrix = fetch_matrix(first, last)
+        for i, date in enumerate(matrix.dates):
+            windows.patch(date, dict(zip(matrix.sensor_ids, matrix.values[:, i])))
+    for d in due:
+        windows.refetches[d] = windows.refetches.get(d, 0) + 1
+
+class RangeIndex:
+    """Query index over the daily history of several sensors for arbitrary date ranges.
+    Prefix sums answer sum and mean in O(1); sparse tables of argmin/argmax positions answer
+    min and max in O(1) after O(n log n) preprocessing. NaN days are ignored.
+    """
+
+    def __init__(self, sensor_ids, dates, values):
+        self.sensor_ids = list(sensor_ids)
+        self.index = {sensor_id: i for i, sensor_id in enumerate(self.sensor_ids)}
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        values = np.asarray(values, dtype=np.float64).reshape(len(self.sensor_ids), len(self.dates))
+        valid = ~np.isnan(values)
+
+        # prefix[:, i] = sum of the first i days, so a range [lo, hi) is prefix[:, hi] - prefix[:, lo]
+        rows = len(self.sensor_ids)
+        self.prefix_sum = np.zeros((rows, len(self.dates) + 1))
+        np.cumsum(np.where(valid, values, 0.0), axis=1, out=self.prefix_sum[:, 1:])
+        self.prefix_count = np.zeros((rows, len(self.dates) + 1), dtype=np.int64)
+        np.cumsum(valid, axis=1, out=self.prefix_count[:, 1:])
+
+        self.values = values
+        # Missing days get keys that never win, so they are only returned for ranges without any value
+        self.min_keys = np.where(valid, values, np.inf)
+        self.max_keys = np.where(valid, values, -np.inf)
+        self.min_table = self._sparse_table(self.min_keys, np.less_equal)
+        self.max_table = self._sparse_table(self.max_keys, np.greater_equal)
+
+    @classmethod
+    def from_matrix(cls, matrix, total_key=None):
+        """Build the index from a SensorDayMatrix; with total_key the per-day totals are added as a row."""
+        if total_key is None:
+            return cls(matrix.sensor_ids, matrix.dates, matrix.values)
+        values = np.vstack([matrix.values, matrix.totals().values])
+        return cls(matrix.sensor_ids + [total_key], matrix.dates, values)
+
+    @staticmethod
+    def _sparse_table(keys, better):
+        """Level k holds, for every start i, the position of the best key in [i, i + 2**k)."""
+        table = [np.broadcast_to(np.arange(keys.shape[1]), keys.shape)]
+        rows = np.arange(keys.shape[0])[:, None]
+        width = 1
+        while 2 * width <= keys.shape[1]:
+            prev = table[-1]
+            left, right = prev[:, :-width], prev[:, width:]
+            table.append(np.where(better(keys[rows, left], keys[rows, right]), left, right))
+            width *= 2
+        return table
+
+    def _span(self, start_date, end_date):
+        """Return the [lo, hi) positions of the indexed days between start_date and end_date (inclusive)."""
+        lo = int(np.searchsorted(self.dates, np.datetime64(start_date, "D"), side="left"))
+        hi = int(np.searchsorted(self.dates, np.datetime64(end_date, "D"), side="right"))
+        return lo, max(lo, hi)
+
+    def days(self, sensor_id, start_date, end_date):
+        """Return the number of days with a value in the range."""
+        row = self.index[sensor_id]
+        lo, hi = self._span(start_date, end_date)
+        return int(self.prefix_count[row, hi] - self.prefix_count[row, lo])
+
+    def sum(self, sensor_id, start_date, end_date):
+        row = self.index[sensor_id]
+        lo, hi = self._span(start_date, end_date)
+        return float(self.prefix_sum[row, hi] - self.prefix_sum[row, lo])
+
+    def mean(self, sensor_id, start_date, end_date):
+        days = self.days(sensor_id, start_date, end_date)
+        return self.sum(sensor_id, start_date, end_date) / days if days else 0.0
+
+    def min_day(self, sensor_id, start_date, end_date):
+        """Return the day with the lowest value in the range as a {'date', 'consumption'} dict."""
+        return self._extreme_day(self.min_table, self.min_keys, np.less_equal, sensor_id, start_date, end_date)
+
+    def max_day(self, sensor_id, start_date, end_date):
+        """Return the day with the highest value in the range as a {'date', 'consumption'} dict."""
+        return self._extreme_day(self.max_table, self.max_keys, np.greater_equal, sensor_id, start_date, end_date)
+
+    def _extreme_day(self, table, keys, better, sensor_id, start_date, end_date):
+        row = self.index[sensor_id]
+        lo, hi = self._span(start_date, end_date)
+        if lo == hi:
+            return {"date": "-", "consumption": 0}
+        # Two overlapping power-of-two blocks cover the range
+        level = (hi - lo).bit_length() - 1
+        a, b = table[level][row, lo], table[level][row, hi - (1 << level)]
+        i = a if better(keys[row, a], keys[row, b]) else b
+        if np.isnan(self.values[row, i]):
+            return {"date": "-", "consumption": 0}
+        return {"date": str(self.dates[i]), "consumption": float(self.values[row, i])}
+
+    def summary(self, sensor_id, start_date, end_date):
+        """Return sum, mean, min/max day and the number of days with data for one sensor and range."""
+        return {
+            "sum_usage": self.sum(sensor_id, start_date, end_date),
+            "avg_usage": self.mean(sensor_id, start_date, end_date),
+            "min_usage": self.min_day(sensor_id, start_date, end_date),
+            "max_usage": self.max_day(sensor_id, start_date, end_date),
+            "days": self.days(sensor_id, start_date, end_date),
+        }
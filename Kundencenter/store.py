@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+# Periods kept as rollups, see bucket_range
+ROLLUP_PERIODS = ("week", "month", "year")
+# Id of the total over all sensors (Gesamt), used by the store, the windows and the live poller
+TOTAL_ID = "00000"
+
+class DailyMetricsStore:
+    """On-disk SQLite store for daily consumption, keyed by (sensor_id, date).
+    Only days before today are stored, since their values no longer change.
+    ISO-week, month and year totals per sensor and for all sensors (TOTAL_ID) are kept as rollups,
+    which are updated for the affected buckets whenever days are stored.
+    """
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "daily_metrics.db")
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shared between the client's worker threads, so access is serialized by a lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # Incremented whenever put() adds days, so derived data can tell that the history changed
+        self.version = 0
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily_metrics ("
+                "sensor_id TEXT NOT NULL, "
+                "date TEXT NOT NULL, "
+                "consumption REAL NOT NULL, "
+                "PRIMARY KEY (sensor_id, date)"
+                ") WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                "sensor_id TEXT NOT NULL, "
+                "period TEXT NOT NULL, "
+                "bucket TEXT NOT NULL, "
+                "consumption REAL NOT NULL, "
+                "days INTEGER NOT NULL, "
+                "PRIMARY KEY (sensor_id, period, bucket)"
+                ") WITHOUT ROWID"
+            )
+            # Databases written before rollups existed get them built once
+            has_days = self.conn.execute("SELECT 1 FROM daily_metrics LIMIT 1").fetchone()
+            has_rollups = self.conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone()
+            if has_days and not has_rollups:
+                days = self.conn.execute("SELECT DISTINCT sensor_id, date FROM daily_metrics").fetchall()
+                self._update_rollups(days)
+
+    def get(self, sensor_id, start_date, end_date):
+        """Return the stored days between start_date and end_date (inclusive), ordered by date."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT date, consumption FROM daily_metrics "
+                "WHERE sensor_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (sensor_id, start_date, end_date),
+            ).fetchall()
+        return [{"date": d, "consumption": c} for d, c in rows]
+
+    def put(self, sensor_id, daily_data):
+        """Store the closed days (before today) of daily_data. Existing days are kept."""
+        today = date.today().strftime("%Y-%m-%d")
+        rows = [
+            (sensor_id, day["date"], day["consumption"])
+            for day in daily_data
+            if day.get("date") and day["date"] < today and day.get("consumption") is not None
+        ]
+        with self.lock, self.conn:
+            changes = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO daily_metrics (sensor_id, date, consumption) VALUES (?, ?, ?)",
+                rows,
+            )
+            if self.conn.total_changes > changes:
+                self.version += 1
+            self._update_rollups([(sensor_id, day) for sensor_id, day, _ in rows])
+        return len(rows)
+
+    def _update_rollups(self, days):
+        """Recompute the rollup buckets containing the given (sensor_id, date) pairs, for each sensor and the total.
+        Must be called with the lock held, inside a transaction.
+        """
+        buckets = {(period,) + bucket_range(period, day) for _, day in days for period in ROLLUP_PERIODS}
+        sensor_ids = {sensor_id for sensor_id, _ in days}
+        for period, bucket, first, last in buckets:
+            for sensor_id in sensor_ids:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO rollups (sensor_id, period, bucket, consumption, days) "
+                    "SELECT ?, ?, ?, SUM(consumption), COUNT(*) FROM daily_metrics "
+                    "WHERE sensor_id = ? AND date BETWEEN ? AND ? HAVING COUNT(*) > 0",
+                    (sensor_id, period, bucket, sensor_id, first, last),
+                )
+            # days counts the distinct dates with data from at least one sensor
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rollups (sensor_id, period, bucket, consumption, days) "
+                "SELECT ?, ?, ?, SUM(consumption), COUNT(DISTINCT date) FROM daily_metrics "
+                "WHERE sensor_id != ? AND date BETWEEN ? AND ? HAVING COUNT(*) > 0",
+                (TOTAL_ID, period, bucket, TOTAL_ID, first, last),
+            )
+
+    def rollups(self, sensor_id, period, first_bucket="", last_bucket="~"):
+        """Return the rollup rows of one sensor (or TOTAL_ID) for period 'week', 'month' or 'year',
+        ordered by bucket, e.g. [{'bucket': '2025-W07', 'consumption': 1234.5, 'days': 7}, ...].
+        """
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"Unknown rollup period: {period}")
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT bucket, consumption, days FROM rollups "
+                "WHERE sensor_id = ? AND period = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+                (sensor_id, period, first_bucket, last_bucket),
+            ).fetchall()
+        return [{"bucket": b, "consumption": c, "days": n} for b, c, n in rows]
+
+    def date_bounds(self):
+        """Return the first and last stored date over all sensors, or (None, None) if the store is empty."""
+        with self.lock:
+            return self.conn.execute("SELECT MIN(date), MAX(date) FROM daily_metrics").fetchone()
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.conn.close()
+
+def bucket_range(period, day):
+    """Return (bucket label, first date, last date) of the week/month/year bucket containing a YYYY-MM-DD date.
+    Weeks are ISO weeks labelled like '2025-W07', months like '2025-02' and years like '2025'.
+    """
+    d = datetime.strptime(day, "%Y-%m-%d").date()
+    if period == "week":
+        year, week, weekday = d.isocalendar()
+        first = d - timedelta(days=weekday - 1)
+        return f"{year}-W{week:02d}", first.strftime("%Y-%m-%d"), (first + timedelta(days=6)).strftime("%Y-%m-%d")
+    if period == "month":
+        next_month = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return d.strftime("%Y-%m"), d.replace(day=1).strftime("%Y-%m-%d"), (next_month - timedelta(days=1)).strftime("%Y-%m-%d")
+    if period == "year":
+        return str(d.year), f"{d.year}-01-01", f"{d.year}-12-31"
+    raise ValueError(f"Unknown rollup period: {period}")
+
+def date_range(start_date, end_date):
+    """Return all dates between start_date and end_date (inclusive) as YYYY-MM-DD strings."""
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+
+def date_runs(dates):
+    """Split sorted YYYY-MM-DD dates into runs of consecutive days, as (first date, last date) pairs."""
+    runs = []
+    previous = None
+    for d in dates:
+        day = datetime.strptime(d, "%Y-%m-%d").date()
+        if previous is not None and day - previous == timedelta(days=1):
+            runs[-1][1] = d
+        else:
+            runs.append([d, d])
+        previous = day
+    return [tuple(run) for run in runs]
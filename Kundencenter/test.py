@@ -1,37 +1,22 @@
 import streamlit as st
 import plotly.graph_objects as go
 import numpy as np
+import math
 import time
 from datetime import datetime, timedelta
-from functions import APIClient, get_day_with_max_consumption, get_day_with_min_consumption, get_mean_consumption, get_sum_consumption
-import base64
-
-def get_base64_image(image_path):
-    """Convert image to base64 string for HTML display"""
-    import os
-    try:
-        # Check if file exists
-        if not os.path.exists(image_path):
-            print(f"DEBUG: Image file does not exist: {image_path}")
-            print(f"DEBUG: Current working directory: {os.getcwd()}")
-            print(f"DEBUG: Files in current directory: {os.listdir('.')}")
-            if os.path.exists('img'):
-                print(f"DEBUG: Files in img directory: {os.listdir('img')}")
-            return ""
-        
-        with open(image_path, "rb") as img_file:
-            base64_string = base64.b64encode(img_file.read()).decode()
-            print(f"DEBUG: Successfully converted {image_path} to base64 (length: {len(base64_string)})")
-            return base64_string
-    except Exception as e:
-        print(f"DEBUG: Error converting image to base64: {e}")
-        return ""
+from functions import shared_api_client
+from series import DailySeries, RangeIndex, SensorDayMatrix, update_windows
+from store import TOTAL_ID
+from live import LivePoller
+from livelog import LiveSampleLog
+from charts import FigureTemplate, gauge_gradient, lttb
+from assets import image_data_uri
 
 print("DEBUG: Starting application initialization...")
 
 # --- CONFIG ---
 print("DEBUG: Setting up Streamlit page config...")
-st.set_page_config(layout="wide")
+st.set_page_config(layout="wide", initial_sidebar_state="collapsed")
 st.markdown("""
     <style>
         .main {background-color: #222228;}
@@ -75,19 +60,49 @@ customer_centers = [
 ]
 print(f"DEBUG: Defined {len(customer_centers)} customer centers")
 
+# Live power polling cadence and the maximum time one poll may take before slow sensors are skipped
+LIVE_REFRESH_SECS = 10
+LIVE_DEADLINE_SECS = 8
+# Live values older than this are shown as stale, with their age
+LIVE_STALE_SECS = 2 * LIVE_REFRESH_SECS
+# Step of the live gauge's maximum (kW); one gauge template is kept per step
+GAUGE_BUCKET_KW = 25
+# Interval at which the detail report cycles to the next customer center
+DETAIL_CYCLE_SECS = 30
+# Time span of the live sparkline (the poller's whole 24 h buffer) and of its rolling average
+LIVE_SPARKLINE_SECS = 24 * 3600
+LIVE_AVERAGE_SECS = 15 * 60
+# Approximate on-screen width of the sparkline (px); longer series are downsampled to one point per pixel
+LIVE_SPARKLINE_WIDTH_PX = 480
+# Display heights (px) of the header logo (4.4rem) and of the detail report boxes; images are pre-resized to these
+LOGO_HEIGHT_PX = 70
+DETAIL_BOX_HEIGHT_PX = 280
+# Maximum time the historical refresh may take before missing sensors are skipped
+HISTORICAL_DEADLINE_SECS = 30
+
+# Daily consumption comes from the API in Wh; the dashboard shows kWh
+KWH_PER_WH = 1 / 1000
+
+# Length of the displayed period and of the comparison period before it (days)
+PERIOD_DAYS = 7
+COMPARISON_DAYS = 7
+
 # --- API CLIENT SETUP ---
 print("DEBUG: Setting up API client...")
 CLIENT_ID = st.secrets["client_id"]  # Replace with your client ID
-CLIENT_SECRET = st.secrets["client_secret"]  # Replace with your client secret
 print(f"DEBUG: API credentials loaded - Client ID: {CLIENT_ID[:8]}...") # Only show first 8 chars for security
 
-api = APIClient(CLIENT_ID, CLIENT_SECRET)
+# Optional overrides in the secrets, e.g. to run against mock_server.py or to record/replay API traffic
+# (see shared_api_client); the client is created once per process and shared by all sessions and reruns
+TRACE_MODE = st.secrets.get("trace_mode")  # "record" or "replay"
+api = shared_api_client(st.secrets, with_store=True)
 print(f"DEBUG: Checking API authentication status...")
 if not hasattr(st.session_state, "api_authenticated"):
     print("DEBUG: API not authenticated yet, attempting authentication...")
     try:
-        print("DEBUG: Calling api.authenticate()...")
-        api.authenticate()
+        # Only authenticates if the shared token manager has no valid token yet
+        print("DEBUG: Calling api.get_access_token()...")
+        api.get_access_token()
         print("DEBUG: API authentication successful!")
         st.session_state.api_authenticated = True
     except Exception as e:
@@ -97,10 +112,26 @@ if not hasattr(st.session_state, "api_authenticated"):
 else:
     print("DEBUG: API already authenticated, skipping authentication step")
 
-# --- DATE RANGE (last 7 days) ---
+@st.cache_resource
+def get_live_poller(_api_client, trace_mode=None):
+    """Start the background live poller once per process; all sessions read its snapshots"""
+    print("DEBUG: Starting shared live poller...")
+    # Replayed samples are not real measurements, so they are not logged
+    sample_log = None if trace_mode == "replay" else LiveSampleLog()
+    poller = LivePoller(
+        _api_client, [cc["sensor_id"] for cc in customer_centers], LIVE_REFRESH_SECS, LIVE_DEADLINE_SECS,
+        sample_log=sample_log,
+    )
+    poller.poll_once()
+    poller.start()
+    return poller
+
+live_poller = get_live_poller(api, TRACE_MODE)
+
+# --- DATE RANGE (last PERIOD_DAYS days) ---
 print("DEBUG: Calculating date range...")
 today = datetime.now().date()
-start_date_obj = today - timedelta(days=7)
+start_date_obj = today - timedelta(days=PERIOD_DAYS)
 end_date_obj = today - timedelta(days=1)
 start_date = start_date_obj.strftime("%Y-%m-%d")
 end_date = end_date_obj.strftime("%Y-%m-%d")
@@ -111,110 +142,97 @@ end_week = end_date_obj.isocalendar()[1]
 start_year = start_date_obj.isocalendar()[0]
 end_year = end_date_obj.isocalendar()[0]
 
+# Previous period (COMPARISON_DAYS days before the current period) for comparison
+prev_end_date_obj = start_date_obj - timedelta(days=1)
+prev_start_date_obj = prev_end_date_obj - timedelta(days=COMPARISON_DAYS - 1)
+prev_start_date = prev_start_date_obj.strftime("%Y-%m-%d")
+prev_end_date = prev_end_date_obj.strftime("%Y-%m-%d")
+
 print(f"DEBUG: Date range calculated - Start: {start_date}, End: {end_date}")
 print(f"DEBUG: Calendar weeks - Start: {start_year}-W{start_week:02d}, End: {end_year}-W{end_week:02d}")
 
 # --- DATA FETCHING & CACHING ---
+def build_entry(sensor_id, name, window):
+    """Build a dashboard entry from the rolling window (kWh) of one sensor or the total"""
+    usage_per_day = window.to_series()
+    stats = usage_per_day.stats()
+    return {
+        "sensor_id": sensor_id,
+        "name": name,
+        "usage_per_day": usage_per_day,
+        "min_usage": usage_per_day.day(stats.argmin),
+        "max_usage": usage_per_day.day(stats.argmax),
+        "sum_usage": stats.sum,
+        "avg_usage": stats.mean,
+        "live_usage": 0,  # Will be updated by fetch_live_data
+    }
+
+def fetch_usage_matrix(window_start, window_end):
+    """Fetch daily usage of all sensors concurrently and align it on one date index (sensors x days, kWh)"""
+    queries = [(cc["sensor_id"], window_start, window_end) for cc in customer_centers]
+    started = time.perf_counter()
+    results = api.usage_series_many(queries, deadline=HISTORICAL_DEADLINE_SECS)
+    print(f"DEBUG: Fetched {len(queries)} windows in {time.perf_counter() - started:.3f}s")
+
+    series = {query[0]: None if results[query] is None else results[query].scaled(KWH_PER_WH) for query in queries}
+    matrix = SensorDayMatrix.from_series(series, window_start, window_end)
+    day_coverage = matrix.day_coverage()
+    incomplete = [str(d) for d, n in zip(matrix.dates, day_coverage) if n < len(customer_centers)]
+    if incomplete:
+        print(f"DEBUG: Days with missing sensor data: {incomplete}")
+    return matrix
+
+def update_history_windows():
+    """Bring the rolling period windows of this session up to end_date (see series.update_windows)"""
+    windows = update_windows(
+        st.session_state.get("history_windows"), end_date, PERIOD_DAYS, COMPARISON_DAYS, fetch_usage_matrix
+    )
+    st.session_state.history_windows = windows
+    return windows
+
+def reconcile_live_energy(windows):
+    """Compare the live-integrated energy of closed days with the daily values from the API"""
+    integrator = live_poller.integrator
+    for sensor_id, date in integrator.pending():
+        if sensor_id not in windows.current:
+            continue
+        series = windows.current[sensor_id].to_series().between(date, date)
+        actual = float(series.values[0]) if len(series) and not np.isnan(series.values[0]) else None
+        error = integrator.reconcile(sensor_id, date, actual)
+        if error is not None:
+            print(f"DEBUG: Live energy estimate for {sensor_id} on {date} was off by {error:+.1%}")
+
 def fetch_historical_data():
     """Fetch historical data (usage per day, statistics) - called once daily at 1 AM"""
     print("DEBUG: Starting fetch_historical_data() function...")
+    windows = update_history_windows()
+    reconcile_live_energy(windows)
+
     db = []
     for cc in customer_centers:
-        print(f"DEBUG: Processing customer center: {cc['name']} (ID: {cc['sensor_id']})")
-        try:
-            print(f"DEBUG: Fetching usage_per_day for {cc['name']}...")
-            usage_per_day_raw = api.usage_per_day(cc["sensor_id"], start_date, end_date)
-            # Convert watts to kilowatts
-            usage_per_day = [{"date": day["date"], "consumption": day["consumption"] / 1000} for day in usage_per_day_raw]
-            print(f"DEBUG: Successfully fetched {len(usage_per_day)} days of data for {cc['name']}")
-            
-            print(f"DEBUG: Calculating statistics for {cc['name']}...")
-            sum_usage = get_sum_consumption(usage_per_day)
-            avg_usage = get_mean_consumption(usage_per_day)
-            min_usage = get_day_with_min_consumption(usage_per_day)
-            max_usage = get_day_with_max_consumption(usage_per_day)
-            
-        except Exception as e:
-            print(f"DEBUG: Error processing {cc['name']}: {e}")
-            usage_per_day = []
-            sum_usage = avg_usage = 0
-            min_usage = max_usage = {"date": "-", "consumption": 0}        
-        db.append({
-            "sensor_id": cc["sensor_id"],
-            "name": cc["name"],
-            "usage_per_day": usage_per_day,
-            "min_usage": min_usage,
-            "max_usage": max_usage,
-            "sum_usage": sum_usage,
-            "avg_usage": avg_usage,
-            "live_usage": 0,  # Will be updated by fetch_live_data
-        })
-        print(f"DEBUG: Added {cc['name']} to database with sum_usage: {sum_usage}")
-    
-    # Gesamt (total)
-    print("DEBUG: Calculating total consumption for all customer centers...")
-    usage_per_day_total = []
-    if db and db[0]["usage_per_day"]:
-        print(f"DEBUG: Database has {len(db)} entries, first entry has {len(db[0]['usage_per_day'])} days of data")
-        for i in range(len(db[0]["usage_per_day"])):
-            date = db[0]["usage_per_day"][i]["date"]
-            consumption = sum(cc["usage_per_day"][i]["consumption"] for cc in db if len(cc["usage_per_day"]) > i)
-            usage_per_day_total.append({"date": date, "consumption": consumption})
-            print(f"DEBUG: Day {date}: Total consumption = {consumption}")
-    else:
-        print("DEBUG: No data available for calculating totals - database is empty or has no usage_per_day data")
+        db.append(build_entry(cc["sensor_id"], cc["name"], windows.current[cc["sensor_id"]]))
+        print(f"DEBUG: Added {cc['name']} to database with sum_usage: {db[-1]['sum_usage']}")
     
-    print("DEBUG: Calculating total statistics...")
-    sum_usage = get_sum_consumption(usage_per_day_total)
-    avg_usage = get_mean_consumption(usage_per_day_total)
-    min_usage = get_day_with_min_consumption(usage_per_day_total)
-    max_usage = get_day_with_max_consumption(usage_per_day_total)
-    print(f"DEBUG: Total statistics - Sum: {sum_usage}, Avg: {avg_usage}")
-    
-    db.append({
-        "sensor_id": "00000",
-        "name": "Gesamt",
-        "usage_per_day": usage_per_day_total,
-        "min_usage": min_usage,
-        "max_usage": max_usage,
-        "sum_usage": sum_usage,
-        "avg_usage": avg_usage,
-        "live_usage": 0,  # Will be updated by fetch_live_data
-    })
+    # Gesamt (total), maintained as its own window from the per-day totals
+    db.append(build_entry(TOTAL_ID, "Gesamt", windows.current[TOTAL_ID]))
+    print(f"DEBUG: Total statistics - Sum: {db[-1]['sum_usage']}, Avg: {db[-1]['avg_usage']}")
     
-    # Also fetch previous week data
-    print("DEBUG: Fetching previous week data...")
-    prev_week_data = fetch_previous_week_data()
+    # Also build previous week data
+    print("DEBUG: Building previous week data...")
+    prev_week_data = fetch_previous_week_data(windows)
     
     print(f"DEBUG: fetch_historical_data() completed with {len(db)} total entries")
     return db, prev_week_data
 
-def fetch_previous_week_data():
-    """Fetch previous week data for comparison"""
+def fetch_previous_week_data(windows):
+    """Build previous week data for comparison from the comparison period windows"""
     print("DEBUG: Starting fetch_previous_week_data() function...")
-    
-    # Calculate previous week date range
-    today = datetime.now().date()
-    current_week_start = today - timedelta(days=7)  # Start of current period
-    prev_week_end = current_week_start - timedelta(days=1)  # End of previous week
-    prev_week_start = prev_week_end - timedelta(days=6)  # Start of previous week (7 days)
-    
-    prev_start_date = prev_week_start.strftime("%Y-%m-%d")
-    prev_end_date = prev_week_end.strftime("%Y-%m-%d")
-    
     print(f"DEBUG: Previous week range - Start: {prev_start_date}, End: {prev_end_date}")
     
     db_prev = []
     for cc in customer_centers:
         print(f"DEBUG: Processing previous week data for {cc['name']}...")
-        try:
-            usage_per_day_raw = api.usage_per_day(cc["sensor_id"], prev_start_date, prev_end_date)
-            # Convert watts to kilowatts
-            usage_per_day = [{"date": day["date"], "consumption": day["consumption"] / 1000} for day in usage_per_day_raw]
-            sum_usage = get_sum_consumption(usage_per_day)
-        except Exception as e:
-            print(f"DEBUG: Error processing previous week data for {cc['name']}: {e}")
-            sum_usage = 0
+        sum_usage = windows.previous[cc["sensor_id"]].sum
         
         db_prev.append({
             "sensor_id": cc["sensor_id"],
@@ -225,7 +243,7 @@ def fetch_previous_week_data():
     # Calculate total for previous week
     total_prev_usage = sum(cc["sum_usage"] for cc in db_prev)
     db_prev.append({
-        "sensor_id": "00000",
+        "sensor_id": TOTAL_ID,
         "name": "Gesamt",
         "sum_usage": total_prev_usage,
     })
@@ -233,32 +251,104 @@ def fetch_previous_week_data():
     print(f"DEBUG: Previous week total usage: {total_prev_usage}")
     return db_prev
 
+@st.cache_resource(max_entries=1)
+def get_history_index(_store, first_date, last_date, store_version):
+    """Index the stored daily history of all sensors (kWh) for date range queries.
+    Rebuilt only when the stored history changes (store_version, which also covers days backfilled
+    inside the bounds); every date picker interaction is answered from the index.
+    """
+    print(f"DEBUG: Building history index from {first_date} to {last_date}...")
+    series = {
+        cc["sensor_id"]: DailySeries.from_records(_store.get(cc["sensor_id"], first_date, last_date)).scaled(KWH_PER_WH)
+        for cc in customer_centers
+    }
+    matrix = SensorDayMatrix.from_series(series, first_date, last_date)
+    return RangeIndex.from_matrix(matrix, total_key=TOTAL_ID)
+
+def clamp_range(start, end, min_date, max_date):
+    """Clamp a default date range to the stored history; falls back to the whole history if they do not overlap"""
+    start, end = max(start, min_date), min(end, max_date)
+    return (start, end) if start <= end else (min_date, max_date)
+
+def query_periods(index, period, comparison):
+    """Return one row per customer center plus Gesamt with the statistics of both date ranges"""
+    rows = []
+    for sensor_id, name in [(cc["sensor_id"], cc["name"]) for cc in customer_centers] + [(TOTAL_ID, "Gesamt")]:
+        current = index.summary(sensor_id, *period)
+        previous = index.summary(sensor_id, *comparison)
+        rows.append({
+            "Kundencenter": name,
+            "Summe (kWh)": round(current["sum_usage"], 2),
+            "Ø pro Tag (kWh)": round(current["avg_usage"], 2),
+            "Min": f'{current["min_usage"]["consumption"]:.2f} ({current["min_usage"]["date"]})',
+            "Max": f'{current["max_usage"]["consumption"]:.2f} ({current["max_usage"]["date"]})',
+            "Vergleich (kWh)": round(previous["sum_usage"], 2),
+            "Differenz (kWh)": round(current["sum_usage"] - previous["sum_usage"], 2),
+            "Tage": f'{current["days"]}/{previous["days"]}',
+        })
+    return rows
+
+def month_comparison(store, months=12):
+    """Return Gesamt totals of the last months next to the same months one year earlier, from the rollups"""
+    last_month = end_date_obj.strftime("%Y-%m")
+    first_month = f"{end_date_obj.year - 2}-{last_month[5:]}"
+    totals = {row["bucket"]: row for row in store.rollups(TOTAL_ID, "month", first_month, last_month)}
+    rows = []
+    for bucket in sorted(totals, reverse=True)[:months]:
+        previous = totals.get(f"{int(bucket[:4]) - 1}{bucket[4:]}")
+        current_sum = totals[bucket]["consumption"] * KWH_PER_WH
+        previous_sum = previous["consumption"] * KWH_PER_WH if previous else None
+        rows.append({
+            "Monat": bucket,
+            "Summe (kWh)": round(current_sum, 2),
+            "Vorjahr (kWh)": round(previous_sum, 2) if previous else None,
+            "Differenz (kWh)": round(current_sum - previous_sum, 2) if previous else None,
+            "Tage": totals[bucket]["days"],
+        })
+    return rows
+
 def fetch_live_data(db):
-    """Fetch only live power data for all customer centers"""
+    """Read live power data for all customer centers from the shared poller snapshot"""
     print("DEBUG: Starting fetch_live_data() function...")
     total_live_usage = 0
-    
+
+    # Failing sensors keep their last good value in the snapshot, together with its fetch time
+    snapshot = live_poller.snapshot()
+    live_power = snapshot["values"]
+    st.session_state.last_live_update = snapshot["timestamp"]
+    print(f"DEBUG: Using live snapshot version {snapshot['version']}")
+
     for i, cc in enumerate(db[:-1]):  # Exclude the 'Gesamt' entry
-        try:
-            print(f"DEBUG: Fetching live power for {cc['name']}...")
-            live_usage = api.get_live_power(cc["sensor_id"]) / 1000  # Convert watts to kilowatts
-            db[i]["live_usage"] = live_usage
-            total_live_usage += live_usage
-            print(f"DEBUG: Live usage for {cc['name']}: {live_usage} kW")
-        except Exception as e:
-            print(f"DEBUG: Error fetching live data for {cc['name']}: {e}")
-            db[i]["live_usage"] = 0
+        watts = live_power.get(cc["sensor_id"])
+        live_updated = snapshot["updated"].get(cc["sensor_id"])
+        if watts is None:
+            print(f"DEBUG: No live data for {cc['name']} yet")
+            db[i] = {**cc, "live_usage": 0, "live_updated": None}
+            continue
+        live_usage = watts / 1000  # Convert watts to kilowatts
+        db[i] = {**cc, "live_usage": live_usage, "live_updated": live_updated}
+        total_live_usage += live_usage
+        print(f"DEBUG: Live usage for {cc['name']}: {live_usage} kW")
     
     # Update total live usage for 'Gesamt'
-    db[-1]["live_usage"] = total_live_usage
+    db[-1] = {**db[-1], "live_usage": total_live_usage}
     print(f"DEBUG: Total live usage: {total_live_usage} kW")
     return db
 
+def format_age(seconds):
+    """Format the age of a value for display, e.g. '45 s' or '3 min'"""
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
 def should_fetch_historical_data():
     """Check if it's time to fetch historical data (daily at 1 AM)"""
     now = datetime.now()
-    # Check if it's 1 AM (between 1:00 and 1:05 to give some window)
-    if now.hour == 1 and now.minute < 5:
+    # Check if it's 1 AM (between 1:00 and 1:05 to give some window), once within that window
+    last_fetch = st.session_state.get("historical_data_last_fetch", 0)
+    if now.hour == 1 and now.minute < 5 and time.time() - last_fetch > 5 * 60:
         return True
     
     # Also fetch on first run if no historical data exists
@@ -292,6 +382,7 @@ def fetch_dashboard_data():
     
     # Always fetch live data
     db = fetch_live_data(db.copy())  # Use copy to avoid modifying cached data
+    print(f"DEBUG: API cache stats: {api.cache_stats()}")
     
     return db
 
@@ -302,7 +393,6 @@ if "dashboard_db" not in st.session_state or "last_update" not in st.session_sta
     print("DEBUG: dashboard_db or last_update not in session state, initializing...")
     st.session_state.dashboard_db = fetch_dashboard_data()
     st.session_state.last_update = time.time()
-    st.session_state.last_live_update = time.time()
 else:
     print("DEBUG: dashboard_db and last_update already in session state")
 
@@ -317,32 +407,11 @@ else:
 if "last_live_update" not in st.session_state:
     st.session_state.last_live_update = time.time()
 
-# Refresh live data every 10 seconds, full data check for historical updates
-current_time = time.time()
-if current_time - st.session_state.last_live_update > 10:  # Live data every 10 seconds
-    print("DEBUG: Live data is older than 10 seconds, updating...")
-    # Only fetch live data if we have historical data cached
-    if "dashboard_db_historical" in st.session_state and st.session_state.dashboard_db_historical:
-        print("DEBUG: Updating only live data...")
-        db = st.session_state.dashboard_db_historical.copy()
-        st.session_state.dashboard_db = fetch_live_data(db)
-    else:
-        print("DEBUG: No historical data cached, fetching full data...")
-        st.session_state.dashboard_db = fetch_dashboard_data()
-    
-    st.session_state.last_live_update = current_time
-    st.session_state.last_update = current_time
-    # Cycle through customer centers for detail view every 30 seconds
-    if current_time - st.session_state.get("last_cc_cycle", 0) > 30:
-        st.session_state.single_cc_idx = (st.session_state.single_cc_idx + 1) % len(customer_centers)
-        st.session_state.last_cc_cycle = current_time
-        print(f"DEBUG: Cycled to single_cc_idx: {st.session_state.single_cc_idx}")
-
 # Check for historical data updates (daily at 1 AM or on first run)
 if should_fetch_historical_data():
     print("DEBUG: Time for historical data update...")
     st.session_state.dashboard_db = fetch_dashboard_data()
-    st.session_state.last_update = current_time
+    st.session_state.last_update = time.time()
 
 # Use current data from session state
 db = st.session_state.dashboard_db
@@ -353,9 +422,34 @@ gesamt = db[-1]
 print(f"DEBUG: Gesamt data - Sum: {gesamt['sum_usage']}, Live: {gesamt['live_usage']}")
 ccs = db[:-1]
 print(f"DEBUG: Individual customer centers: {len(ccs)} entries")
-single_idx = st.session_state.single_cc_idx
-single_cc = ccs[single_idx]
-print(f"DEBUG: Selected single CC for detail view: {single_cc['name']} (index {single_idx})")
+
+# --- ZEITRAUM QUERIES (sidebar) ---
+# Answered from the stored history, so changing the date pickers never triggers API requests
+first_stored, last_stored = api.store.date_bounds()
+with st.sidebar:
+    st.markdown('<span class="yellow-text medium">Zeitraum</span>', unsafe_allow_html=True)
+    if first_stored is None:
+        st.write("Noch keine gespeicherten Tageswerte.")
+    else:
+        history_index = get_history_index(api.store, first_stored, last_stored, api.store.version)
+        min_date = datetime.strptime(first_stored, "%Y-%m-%d").date()
+        max_date = datetime.strptime(last_stored, "%Y-%m-%d").date()
+        period = st.date_input(
+            "Zeitraum", value=clamp_range(start_date_obj, end_date_obj, min_date, max_date),
+            min_value=min_date, max_value=max_date, key="query_period",
+        )
+        comparison = st.date_input(
+            "Vergleichszeitraum", value=clamp_range(prev_start_date_obj, prev_end_date_obj, min_date, max_date),
+            min_value=min_date, max_value=max_date, key="query_comparison",
+        )
+        # While a range is being picked, date_input returns only its start
+        if len(period) == 2 and len(comparison) == 2:
+            st.dataframe(query_periods(history_index, period, comparison), hide_index=True)
+        st.markdown('<span class="yellow-text medium">Monatsvergleich</span>', unsafe_allow_html=True)
+        st.dataframe(month_comparison(api.store), hide_index=True)
+    # Frames of the live and detail sections since the session started (updated on full reruns)
+    render_stats = st.session_state.get("render_stats", {"rendered": 0, "skipped": 0})
+    st.caption(f'Frames: {render_stats["rendered"]} neu gerendert, {render_stats["skipped"]} unverändert')
 
 # --- DASHBOARD HEADER ---
 # Format week display
@@ -370,15 +464,16 @@ header_col1, header_col2 = st.columns([1, 4])
 with header_col1:
     # Display logo
     try:
-        logo_base64 = get_base64_image("Kundencenter/img/logo.png")
+        logo_uri = image_data_uri("logo", LOGO_HEIGHT_PX)
+        if logo_uri is None:
+            raise FileNotFoundError("img/logo.png")
         st.markdown(
             f'<div style="display: flex; align-items: center; height: 100%;">'
-            f'<img src="data:image/png;base64,{logo_base64}" '
+            f'<img src="{logo_uri}" '
             f'style="height: 4.4rem; width: auto; object-fit: contain;" />'
             f'</div>',
             unsafe_allow_html=True
         )
-        print("DEBUG: Successfully loaded img/logo.png")
     except Exception as e:
         print(f"DEBUG: Could not load img/logo.png: {e}")
         # Fallback: show a placeholder
@@ -392,322 +487,363 @@ with header_col1:
 with header_col2:
     st.markdown(
         f'<span class="yellow-text big">Gesamtübersicht Kundencenter Burgenland Energie</span> '
-        f'<span class="gray-text" style="font-size:1.2rem;">(letzten 7 Tage)</span>',
+        f'<span class="gray-text" style="font-size:1.2rem;">(letzten {PERIOD_DAYS} Tage)</span>',
         unsafe_allow_html=True
     )
 
 st.markdown('<br>', unsafe_allow_html=True)
 
-# Create placeholders for real-time updates
-status_placeholder = st.empty()
-main_placeholder = st.empty()
+# Change detection: each section is fingerprinted by the data it shows and only rebuilt when that changes.
+# Streamlit clears fragment elements that are not sent again, so unchanged sections re-send their previous
+# element; large elements then go out as a reference to the copy the browser already has.
+def memoized_section(section, fingerprint, build):
+    """Return the content of a section, rebuilding it only if its fingerprint changed since the last frame"""
+    cache = st.session_state.setdefault("section_cache", {})
+    stats = st.session_state.setdefault("render_stats", {"rendered": 0, "skipped": 0})
+    entry = cache.get(section)
+    if entry is not None and entry[0] == fingerprint:
+        stats["skipped"] += 1
+        return entry[1]
+    content = build()
+    cache[section] = (fingerprint, content)
+    stats["rendered"] += 1
+    return content
+
+def build_status_html(ccs):
+    """Fixed-position status bar with live/historical update times and stale sensors"""
+    # Update status indicator: red if the poller itself is behind, yellow if single sensors are stale
+    now = time.time()
+    time_since_update = now - st.session_state.last_live_update
+    stale_ccs = [cc for cc in ccs if cc.get("live_updated") is None or now - cc["live_updated"] > LIVE_STALE_SECS]
+    if time_since_update > LIVE_STALE_SECS + LIVE_REFRESH_SECS:
+        status_color = "🔴"
+    elif time_since_update > LIVE_STALE_SECS or stale_ccs:
+        status_color = "🟡"
+    else:
+        status_color = "🟢"
+    stale_str = ", ".join(
+        f'{cc["name"]} ({format_age(now - cc["live_updated"])})' if cc.get("live_updated") else f'{cc["name"]} (-)'
+        for cc in stale_ccs
+    )
+    # Get historical data timing info
+    historical_last_fetch = st.session_state.get("historical_data_last_fetch", 0)
+    historical_time_str = datetime.fromtimestamp(historical_last_fetch).strftime("%d.%m %H:%M") if historical_last_fetch > 0 else "Not yet"
+    next_historical_update = "01:00" if datetime.now().hour < 1 else "Tomorrow 01:00"
+
+    return (
+        f'<div style="position: fixed; top: 10px; left: 10px; z-index: 999; background: rgba(0,0,0,0.8); padding: 5px 10px; border-radius: 15px;">'
+        f'<span style="color: white; font-size: 0.8rem;">'
+        f'{status_color} Live: {datetime.fromtimestamp(st.session_state.last_live_update).strftime("%H:%M:%S")} | '
+        f'📊 Historical: {historical_time_str} (Next: {next_historical_update})'
+        + (f' | ⚠️ Veraltet: {stale_str}' if stale_ccs else '') +
+        f'</span>'
+        f'</div>'
+    )
 
-# Real-time dashboard loop
-for seconds in range(3600):  # Run for 1 hour (3600 seconds)
-    # Check if we need to refresh live data (every 10 seconds)
-    current_time = time.time()
-    if current_time - st.session_state.last_live_update > 10:
-        print("DEBUG: Refreshing live data in real-time loop...")
-        # Only fetch live data if we have historical data cached
-        if "dashboard_db_historical" in st.session_state and st.session_state.dashboard_db_historical:
-            print("DEBUG: Updating only live data in loop...")
-            db = st.session_state.dashboard_db_historical.copy()
-            st.session_state.dashboard_db = fetch_live_data(db)
-        else:
-            print("DEBUG: No historical data cached in loop, fetching full data...")
-            st.session_state.dashboard_db = fetch_dashboard_data()
-        
-        st.session_state.last_live_update = current_time
-        st.session_state.last_update = current_time
-        
-        # Cycle through customer centers for detail view every 30 seconds
-        if current_time - st.session_state.get("last_cc_cycle", 0) > 30:
-            st.session_state.single_cc_idx = (st.session_state.single_cc_idx + 1) % len(customer_centers)
-            st.session_state.last_cc_cycle = current_time
-        
-        # Update data references
-        db = st.session_state.dashboard_db
-        gesamt = db[-1]
-        ccs = db[:-1]
-        single_idx = st.session_state.single_cc_idx
-        single_cc = ccs[single_idx]
-    
-    # Check for historical data updates (daily at 1 AM)
-    if should_fetch_historical_data():
-        print("DEBUG: Time for historical data update in loop...")
-        st.session_state.dashboard_db = fetch_dashboard_data()
-        st.session_state.last_update = current_time
-        
-        # Update data references
-        db = st.session_state.dashboard_db
-        gesamt = db[-1]
-        ccs = db[:-1]
-        single_idx = st.session_state.single_cc_idx
-        single_cc = ccs[single_idx]
-    
-    # Update status indicator
-    time_since_update = time.time() - st.session_state.last_live_update
-    status_color = "🟢" if time_since_update < 5 else "🟡" if time_since_update < 10 else "🔴"    
-    with status_placeholder.container():
-        # Get historical data timing info
-        historical_last_fetch = st.session_state.get("historical_data_last_fetch", 0)
-        historical_time_str = datetime.fromtimestamp(historical_last_fetch).strftime("%d.%m %H:%M") if historical_last_fetch > 0 else "Not yet"
-        next_historical_update = "01:00" if datetime.now().hour < 1 else "Tomorrow 01:00"
-        
-        st.markdown(
-            f'<div style="position: fixed; top: 10px; left: 10px; z-index: 999; background: rgba(0,0,0,0.8); padding: 5px 10px; border-radius: 15px;">'
-            f'<span style="color: white; font-size: 0.8rem;">'
-            f'{status_color} Live: {datetime.fromtimestamp(st.session_state.last_live_update).strftime("%H:%M:%S")} | '
-            f'📊 Historical: {historical_time_str} (Next: {next_historical_update})'
-            f'</span>'
-            f'</div>',
-            unsafe_allow_html=True
+def figure_template(key, build):
+    """Return this session's FigureTemplate for key, building it on first use"""
+    templates = st.session_state.setdefault("figure_templates", {})
+    if key not in templates:
+        templates[key] = FigureTemplate(build())
+    return templates[key]
+
+def build_gauge_figure(gauge_max):
+    """Gauge template for one gauge_max with a green-yellow-red gradient; the value is patched in per frame"""
+    print(f"DEBUG: Building gauge template for max {gauge_max}")
+
+    fig = go.Figure()
+
+    # Fine-grained color steps for a gradual transition; the gradient colors are computed once
+    num_steps = 20
+    steps = [
+        {
+            'range': [(gauge_max / num_steps) * i, (gauge_max / num_steps) * (i + 1)],
+            'color': color,
+            'thickness': 0.2
+        }
+        for i, color in enumerate(gauge_gradient(num_steps))
+    ]
+
+    # Add gauge indicator with needle
+    fig.add_trace(go.Indicator(
+        mode="gauge+number",
+        value=0,
+        number={'suffix': ' kW', 'font': {'size': 20, 'color': 'white'}},
+        gauge={
+            'axis': {
+                'range': [0, gauge_max], 
+                'tickcolor': 'white', 
+                'tickwidth': 2, 
+                'ticklen': 10,
+                'tickfont': {'color': 'white', 'size': 12, 'family': 'Arial'},
+                'showticklabels': True,
+                'tickmode': 'linear',
+                'tick0': 0,
+                'dtick': gauge_max / 4
+            },
+            'bar': {'color': "rgba(0,0,0,0)", 'line': {'color':"rgba(0,0,0,0)" }},  # Hide the bar
+            'bgcolor': "rgba(0,0,0,0)",
+            'borderwidth': 0,
+            'steps': steps,
+            'threshold': {
+                'line': {'color': 'white', 'width': 6},
+                'thickness': 1.0,
+                'value': 0
+            }
+        },
+        domain={'x': [0, 1], 'y': [0, 0.8]}  # Changed from [0, 1] to [0, 0.8] to move gauge down
+    ))
+
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=40, b=20),  # Increased top margin from 20 to 40
+        height=220,  # Changed from 300 to 150
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        font={'color': 'white', 'size': 12, 'family': 'Arial'},
+        showlegend=False
+    )
+    return fig
+
+def build_sparkline_figure(spark_times, spark_values):
+    """Minimal line chart of the live power, without axes"""
+    # Up to 8640 samples (24 h at 10 s) are reduced to one point per pixel; the section is only
+    # rebuilt when a new sample arrives, so this runs once per poll
+    spark_times, spark_values = lttb(spark_times, spark_values, LIVE_SPARKLINE_WIDTH_PX)
+    spark_fig = go.Figure(go.Scatter(
+        x=spark_times * 1000, y=spark_values,  # Epoch milliseconds on a date axis
+        mode="lines", line={'color': '#FFCC00', 'width': 2}, hoverinfo="skip",
+    ))
+    spark_fig.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        height=60,
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        xaxis={'visible': False, 'type': 'date'},
+        yaxis={'visible': False},
+        showlegend=False
+    )
+    return spark_fig
+
+def build_detail_boxes(single_cc):
+    """HTML of the five detail report columns: image, sum, average, maximum and minimum"""
+    boxes = []
+    # Display image for the current customer center, encoded once per process
+    image_uri = image_data_uri(single_cc['name'], DETAIL_BOX_HEIGHT_PX)
+    if image_uri is not None:
+        # Use HTML to control image size - height matches the boxes
+        boxes.append(
+            f'<div style="height: 280px; display: flex; justify-content: center; align-items: center;">'
+            f'<img src="{image_uri}" '
+            f'style="height: 280px; width: auto; object-fit: contain; border-radius: 8px;" />'
+            f'</div>'
         )
-    
-    # Update main dashboard content
-    with main_placeholder.container():
-        col1, col2, col3 = st.columns([1, 1, 1])
-
-        with col1:
-            # Gesamtverbrauch über gewählten Zeitraum and Vorwoche
-            print(f"DEBUG: Rendering column 1 with gesamt data - sum: {gesamt['sum_usage']}, avg: {gesamt['avg_usage']}")
-            st.markdown(
-                f'<div class="box flex-row gap-1" style="height: 15vh; margin-bottom: 10px; display: flex; align-items: center;">'
-                f'<span class="box-icon yellow-text">⚡</span>'
-                f'<div><b style="font-size: 1rem;">Gesamtverbrauch </b><br>'
-                f'<span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{gesamt["sum_usage"]:.0f}</span> '
-                f'<span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
-                f'</div>',
-                unsafe_allow_html=True
-            )
-            
-            # Dummy diff for now, you can calculate real difference if you fetch last week's data
-            # Get previous week data
-            prev_week_data = st.session_state.get("previous_week_data", [])
-            if prev_week_data:
-                # Find the matching previous week data (Gesamt entry)
-                prev_gesamt = next((item for item in prev_week_data if item["name"] == "Gesamt"), None)
-                if prev_gesamt and prev_gesamt["sum_usage"] > 0:
-                    absolute_kwh = gesamt["sum_usage"] - prev_gesamt["sum_usage"]
-                    diff_kw = (absolute_kwh / prev_gesamt["sum_usage"]) * 100 if prev_gesamt["sum_usage"] > 0 else 0
-                    prev_week_total = prev_gesamt["sum_usage"]
-                else:
-                    # Fallback to dummy data if no previous week data
-                    diff_kw = np.random.uniform(-30, 30)
-                    absolute_kwh = diff_kw * gesamt["sum_usage"] / 100
-                    prev_week_total = gesamt["sum_usage"] + absolute_kwh
-            else:
-                # Fallback to dummy data if no previous week data
-                diff_kw = np.random.uniform(-30, 30)
-                absolute_kwh = diff_kw * gesamt["sum_usage"] / 100
-                prev_week_total = gesamt["sum_usage"] + absolute_kwh
-            
-            st.markdown(
-                f'<div class="box flex-row gap-1" style="height: 15vh; display: flex; align-items: center;">'
-                f'<span class="box-icon yellow-text">📊</span>'
-                f'<div><b style="font-size: 1rem;">Gesamtverbrauch Vorperiode</b><br>'
-                f'<span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{absolute_kwh:+.2f}</span> '
-                f'<span class="gray-text" style="font-size: 1rem;">kWh</span> '
-                f'<span class="gray-text" style="font-size: 1rem;">({diff_kw:+.2f}%)</span><br>'
-                f'<span class="gray-text" style="font-size: 1rem;">{prev_week_total:.2f} kWh</span></div>'
-                f'</div>',
-                unsafe_allow_html=True
-            )
-
-        with col2:
-            # Täglicher Durchschnitt, Höchster Verbrauch, Niedrigster Verbrauch
-            st.markdown(f'<div class="box flex-row gap-1" style="height: 10vh; margin-bottom: 10px; display: flex; align-items: center;"><span class="box-icon yellow-text">📅</span><div><b style="font-size: 1rem;">Täglicher Durchschnitt</b><br><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{gesamt["avg_usage"]:.2f}</span> <span class="gray-text" style="font-size: 1rem;">kWh</span></div></div>', unsafe_allow_html=True)
-            
-            max_cc = max(ccs, key=lambda x: x["sum_usage"])
-            min_cc = min(ccs, key=lambda x: x["sum_usage"])
-            print(f"DEBUG: Max CC: {max_cc['name']} ({max_cc['sum_usage']}), Min CC: {min_cc['name']} ({min_cc['sum_usage']})")
-            
-            st.markdown(f'<div class="box box-red flex-row gap-1" style="height: 10vh; margin-bottom: 10px; display: flex; align-items: center;"><span class="box-icon yellow-text">📈</span><div><b style="font-size: 1rem;">Höchster Verbrauch</b><br><span class="white-text" style="font-size: 1rem;">{max_cc["name"]}</span><br><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{max_cc["sum_usage"]:.1f}</span> <span class="gray-text" style="font-size: 1rem;">kWh</span></div></div>', unsafe_allow_html=True)
-            
-            st.markdown(f'<div class="box box-green flex-row gap-1" style="height: 10vh; display: flex; align-items: center;"><span class="box-icon yellow-text">📉</span><div><b style="font-size: 1rem;">Niedrigster Verbrauch</b><br><span class="white-text" style="font-size: 1rem;">{min_cc["name"]}</span><br><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{min_cc["sum_usage"]:.1f}</span> <span class="gray-text" style="font-size: 1rem;">kWh</span></div></div>', unsafe_allow_html=True)
-
-        with col3:
-            # Live indicator and gauge
-            print(f"DEBUG: Rendering column 3 with live usage gauge: {gesamt['live_usage']} kW")
-            st.markdown(
-                '<div class="center">'
-                '<span class="yellow-text medium" style="margin-right:20px;">● Live</span>'
-                '<span class="white-text medium" style="font-size:1.2rem;">Gesamtverbrauch</span>'
-                '</div>',
-                unsafe_allow_html=True
-            )
-            
-            # Calculate gauge max value
-            gauge_max = max(100, gesamt["live_usage"] * 1.3)
-            print(f"DEBUG: Gauge max value calculated: {gauge_max}")
-            
-            fig = go.Figure()
-            
-            # Create fine-grained color steps for gradual transition
-            num_steps = 20  # Number of color steps for smooth transition
-            steps = []
-            
-            for i in range(num_steps):
-                start_range = (gauge_max / num_steps) * i
-                end_range = (gauge_max / num_steps) * (i + 1)
-                
-                # Calculate progress from 0 to 1
-                progress = i / (num_steps - 1)
-                
-                if progress <= 0.5:
-                    # Green to Yellow transition (first half)
-                    # Green: #0EB313, Yellow: #FFFF00
-                    red = int(14 + (255 - 14) * (progress * 2))
-                    green = int(179 + (255 - 179) * (progress * 2))
-                    blue = int(19 * (1 - progress * 2))
-                else:
-                    # Yellow to Red transition (second half)
-                    # Yellow: #FFFF00, Red: #F44336
-                    red = int(255 + (244 - 255) * ((progress - 0.5) * 2))
-                    green = int(255 + (67 - 255) * ((progress - 0.5) * 2))
-                    blue = int(0 + (54 - 0) * ((progress - 0.5) * 2))
-                
-                # Ensure values are within valid range
-                red = max(0, min(255, red))
-                green = max(0, min(255, green))
-                blue = max(0, min(255, blue))
-                
-                color = f"rgb({red},{green},{blue})"
-                
-                steps.append({
-                    'range': [start_range, end_range], 
-                    'color': color, 
-                    'thickness': 0.2
-                })
-            
-            # Add gauge indicator with needle
-            fig.add_trace(go.Indicator(
-                mode="gauge+number",
-                value=gesamt["live_usage"],
-                number={'suffix': ' kW', 'font': {'size': 20, 'color': 'white'}},
-                gauge={
-                    'axis': {
-                        'range': [0, gauge_max], 
-                        'tickcolor': 'white', 
-                        'tickwidth': 2, 
-                        'ticklen': 10,
-                        'tickfont': {'color': 'white', 'size': 12, 'family': 'Arial'},
-                        'showticklabels': True,
-                        'tickmode': 'linear',
-                        'tick0': 0,
-                        'dtick': gauge_max / 4
-                    },
-                    'bar': {'color': "rgba(0,0,0,0)", 'line': {'color':"rgba(0,0,0,0)" }},  # Hide the bar
-                    'bgcolor': "rgba(0,0,0,0)",
-                    'borderwidth': 0,
-                    'steps': steps,
-                    'threshold': {
-                        'line': {'color': 'white', 'width': 6},
-                        'thickness': 1.0,
-                        'value': gesamt["live_usage"]
-                    }
-                },
-                domain={'x': [0, 1], 'y': [0, 0.8]}  # Changed from [0, 1] to [0, 0.8] to move gauge down
-            ))
-            
-            fig.update_layout(
-                margin=dict(l=20, r=20, t=40, b=20),  # Increased top margin from 20 to 40
-                height=220,  # Changed from 300 to 150
-                paper_bgcolor="rgba(0,0,0,0)",
-                plot_bgcolor="rgba(0,0,0,0)",
-                font={'color': 'white', 'size': 12, 'family': 'Arial'},
-                showlegend=False
-            )
-            
-            st.plotly_chart(fig, use_container_width=True, key=f"gauge_chart_{seconds}")
-
-        st.markdown('<div style="height: 48px;"></div>', unsafe_allow_html=True)
-
-        # Title above the entire row of 5 squares
-        st.markdown(
-            f'<span class="white-text medium"><span class="box-icon yellow-text">🔄</span>{single_cc["name"]} Detailbericht</span>',
-            unsafe_allow_html=True
+    else:
+        print(f"DEBUG: No image for {single_cc['name']} in img/")
+        # Fallback: show a placeholder
+        boxes.append(
+            f'<div class="box" style="height:280px; display:flex; flex-direction:column; justify-content:center; align-items:center;">'
+            f'<span class="yellow-text" style="font-size:2rem; text-align:center;">{single_cc["name"]}</span><br>'
+            f'<span class="gray-text" style="text-align:center;">Kundencenter</span>'
+            '</div>'
+        )
+
+    # Gesamtverbrauch
+    boxes.append(
+        f'<div class="box flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
+        f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">⚡</span>'
+        f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 12px;">Gesamtverbrauch</div>'
+        f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["sum_usage"]:.0f}</span></div>'
+        f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
+        f'</div>'
+    )
+
+    # Täglicher Durchschnitt
+    boxes.append(
+        f'<div class="box flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
+        f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">📅</span>'
+        f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 12px;">Täglicher Durchschnitt</div>'
+        f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["avg_usage"]:.2f}</span></div>'
+        f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
+        f'</div>'
+    )
+
+    # Maximalverbrauch
+    boxes.append(
+        f'<div class="box box-red flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
+        f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">📈</span>'
+        f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 8px;">Maximalverbrauch</div>'
+        f'<div style="font-size: 1rem; color: white; margin-bottom: 8px;">{single_cc["max_usage"]["date"]}</div>'
+        f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["max_usage"]["consumption"]:.2f}</span></div>'
+        f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
+        f'</div>'
+    )
+
+    # Minimalverbrauch
+    boxes.append(
+        f'<div class="box box-green flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
+        f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">📉</span>'
+        f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 8px;">Minimalverbrauch</div>'
+        f'<div style="font-size: 1rem; color: white; margin-bottom: 8px;">{single_cc["min_usage"]["date"]}</div>'
+        f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["min_usage"]["consumption"]:.2f}</span></div>'
+        f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
+        f'</div>'
+    )
+    return boxes
+
+# Fragments rerun on their own cadence; a full rerun only happens on first load, widget changes and
+# when the historical data is refreshed
+@st.fragment(run_every=LIVE_REFRESH_SECS)
+def live_section():
+    """Live gauge, sparkline and status bar - reruns on the live polling cadence"""
+    # The historical refresh needs the recomputed date range, so it reruns the whole dashboard
+    if should_fetch_historical_data():
+        print("DEBUG: Time for historical data update, rerunning dashboard...")
+        st.rerun()
+
+    # Only merge live values into the dashboard data if the poller published a new snapshot
+    data_version = (live_poller.snapshot()["version"], st.session_state.get("historical_data_last_fetch"))
+    if st.session_state.get("live_data_version") != data_version:
+        db = fetch_live_data(st.session_state.dashboard_db_historical.copy())  # Use copy to avoid modifying cached data
+        st.session_state.dashboard_db = db
+        st.session_state.live_data_version = data_version
+        st.session_state.last_update = time.time()
+    db = st.session_state.dashboard_db
+    gesamt = db[-1]
+
+    # The status bar shows clock times and ages, so it changes on every frame anyway
+    st.markdown(build_status_html(db[:-1]), unsafe_allow_html=True)
+
+    # Live indicator and gauge
+    st.markdown(
+        '<div class="center">'
+        '<span class="yellow-text medium" style="margin-right:20px;">● Live</span>'
+        '<span class="white-text medium" style="font-size:1.2rem;">Gesamtverbrauch</span>'
+        '</div>',
+        unsafe_allow_html=True
+    )
+    live_usage = gesamt["live_usage"]
+    # The gauge range comes in fixed buckets, so one template per bucket can be reused
+    gauge_max = GAUGE_BUCKET_KW * math.ceil(max(100, live_usage * 1.3) / GAUGE_BUCKET_KW)
+    fig = memoized_section(
+        "gauge", live_usage,
+        lambda: figure_template(("gauge", gauge_max), lambda: build_gauge_figure(gauge_max)).patch(
+            {0: {"value": live_usage, "gauge.threshold.value": live_usage}}
+        ),
+    )
+    st.plotly_chart(fig, use_container_width=True, key="gauge_chart")
+
+    # Sparkline of the total live power over the last 24 h from the poller's sample buffer
+    live_history = live_poller.history[TOTAL_ID]
+    spark_times, spark_values = live_history.window(LIVE_SPARKLINE_SECS)
+    if len(spark_values) > 1:
+        spark_fig = memoized_section(
+            "sparkline", (live_history.latest(), len(spark_values)),
+            lambda: build_sparkline_figure(spark_times, spark_values),
         )
+        st.plotly_chart(spark_fig, use_container_width=True, key="live_sparkline")
+
+    # Today's energy so far, integrated from the live samples (no extra API calls)
+    today_usage = sum(live_poller.integrator.today(cc["sensor_id"]) for cc in customer_centers)
+    live_average = live_history.mean(LIVE_AVERAGE_SECS)
+    average_str = f' | Ø {LIVE_AVERAGE_SECS // 60} min: {live_average:.1f} kW' if live_average is not None else ""
+    st.markdown(
+        f'<div class="center"><span class="gray-text" style="font-size: 0.9rem;">'
+        f'Heute bisher: {today_usage:.1f} kWh{average_str}</span></div>',
+        unsafe_allow_html=True
+    )
+    print(f"DEBUG: Render stats: {st.session_state.render_stats}")
+
+@st.fragment(run_every=DETAIL_CYCLE_SECS)
+def detail_section():
+    """Detail report of one customer center - cycles to the next one every DETAIL_CYCLE_SECS"""
+    current_time = time.time()
+    if current_time - st.session_state.setdefault("last_cc_cycle", current_time) >= DETAIL_CYCLE_SECS:
+        st.session_state.single_cc_idx = (st.session_state.single_cc_idx + 1) % len(customer_centers)
+        st.session_state.last_cc_cycle = current_time
+        print(f"DEBUG: Cycled to single_cc_idx: {st.session_state.single_cc_idx}")
+    # The detail boxes only show historical values
+    single_cc = st.session_state.dashboard_db_historical[st.session_state.single_cc_idx]
+
+    # Title above the entire row of 5 squares
+    st.markdown(
+        f'<span class="white-text medium"><span class="box-icon yellow-text">🔄</span>{single_cc["name"]} Detailbericht</span>',
+        unsafe_allow_html=True
+    )
+
+    # Create 5 equal columns: image + 4 data boxes
+    boxes = memoized_section(
+        "detail", (st.session_state.single_cc_idx, st.session_state.get("historical_data_last_fetch")),
+        lambda: build_detail_boxes(single_cc),
+    )
+    for column, box in zip(st.columns([1, 1, 1, 1, 1]), boxes):
+        column.markdown(box, unsafe_allow_html=True)
+
+    print(f"DEBUG: Rendering detail view for {single_cc['name']} - Sum: {single_cc['sum_usage']}, Avg: {single_cc['avg_usage']}")
+    print(f"DEBUG: Detail view Min/Max - Min: {single_cc['min_usage']}, Max: {single_cc['max_usage']}")
+
+col1, col2, col3 = st.columns([1, 1, 1])
+
+with col1:
+    # Gesamtverbrauch über gewählten Zeitraum and Vorwoche
+    print(f"DEBUG: Rendering column 1 with gesamt data - sum: {gesamt['sum_usage']}, avg: {gesamt['avg_usage']}")
+    st.markdown(
+        f'<div class="box flex-row gap-1" style="height: 15vh; margin-bottom: 10px; display: flex; align-items: center;">'
+        f'<span class="box-icon yellow-text">⚡</span>'
+        f'<div><b style="font-size: 1rem;">Gesamtverbrauch </b><br>'
+        f'<span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{gesamt["sum_usage"]:.0f}</span> '
+        f'<span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
+        f'</div>',
+        unsafe_allow_html=True
+    )
+
+    # Dummy diff for now, you can calculate real difference if you fetch last week's data
+    # Get previous week data
+    prev_week_data = st.session_state.get("previous_week_data", [])
+    if prev_week_data:
+        # Find the matching previous week data (Gesamt entry)
+        prev_gesamt = next((item for item in prev_week_data if item["name"] == "Gesamt"), None)
+        if prev_gesamt and prev_gesamt["sum_usage"] > 0:
+            absolute_kwh = gesamt["sum_usage"] - prev_gesamt["sum_usage"]
+            diff_kw = (absolute_kwh / prev_gesamt["sum_usage"]) * 100 if prev_gesamt["sum_usage"] > 0 else 0
+            prev_week_total = prev_gesamt["sum_usage"]
+        else:
+            # Fallback to dummy data if no previous week data
+            diff_kw = np.random.uniform(-30, 30)
+            absolute_kwh = diff_kw * gesamt["sum_usage"] / 100
+            prev_week_total = gesamt["sum_usage"] + absolute_kwh
+    else:
+        # Fallback to dummy data if no previous week data
+        diff_kw = np.random.uniform(-30, 30)
+        absolute_kwh = diff_kw * gesamt["sum_usage"] / 100
+        prev_week_total = gesamt["sum_usage"] + absolute_kwh
+
+    st.markdown(
+        f'<div class="box flex-row gap-1" style="height: 15vh; display: flex; align-items: center;">'
+        f'<span class="box-icon yellow-text">📊</span>'
+        f'<div><b style="font-size: 1rem;">Gesamtverbrauch Vorperiode</b><br>'
+        f'<span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{absolute_kwh:+.2f}</span> '
+        f'<span class="gray-text" style="font-size: 1rem;">kWh</span> '
+        f'<span class="gray-text" style="font-size: 1rem;">({diff_kw:+.2f}%)</span><br>'
+        f'<span class="gray-text" style="font-size: 1rem;">{prev_week_total:.2f} kWh</span></div>'
+        f'</div>',
+        unsafe_allow_html=True
+    )
+
+with col2:
+    # Täglicher Durchschnitt, Höchster Verbrauch, Niedrigster Verbrauch
+    st.markdown(f'<div class="box flex-row gap-1" style="height: 10vh; margin-bottom: 10px; display: flex; align-items: center;"><span class="box-icon yellow-text">📅</span><div><b style="font-size: 1rem;">Täglicher Durchschnitt</b><br><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{gesamt["avg_usage"]:.2f}</span> <span class="gray-text" style="font-size: 1rem;">kWh</span></div></div>', unsafe_allow_html=True)
+
+    max_cc = max(ccs, key=lambda x: x["sum_usage"])
+    min_cc = min(ccs, key=lambda x: x["sum_usage"])
+    print(f"DEBUG: Max CC: {max_cc['name']} ({max_cc['sum_usage']}), Min CC: {min_cc['name']} ({min_cc['sum_usage']})")
+
+    st.markdown(f'<div class="box box-red flex-row gap-1" style="height: 10vh; margin-bottom: 10px; display: flex; align-items: center;"><span class="box-icon yellow-text">📈</span><div><b style="font-size: 1rem;">Höchster Verbrauch</b><br><span class="white-text" style="font-size: 1rem;">{max_cc["name"]}</span><br><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{max_cc["sum_usage"]:.1f}</span> <span class="gray-text" style="font-size: 1rem;">kWh</span></div></div>', unsafe_allow_html=True)
+
+    st.markdown(f'<div class="box box-green flex-row gap-1" style="height: 10vh; display: flex; align-items: center;"><span class="box-icon yellow-text">📉</span><div><b style="font-size: 1rem;">Niedrigster Verbrauch</b><br><span class="white-text" style="font-size: 1rem;">{min_cc["name"]}</span><br><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{min_cc["sum_usage"]:.1f}</span> <span class="gray-text" style="font-size: 1rem;">kWh</span></div></div>', unsafe_allow_html=True)
+
+with col3:
+    live_section()
+
+st.markdown('<div style="height: 48px;"></div>', unsafe_allow_html=True)
 
-        # Create 5 equal columns: image + 4 data boxes
-        col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 1])
-
-        with col1:
-            # Display image for the current customer center
-            print(f"DEBUG: Displaying image for {single_cc['name']}")
-            image_path = f"Kundencenter/img/{single_cc['name'].lower()}.png"  # Remove the "./" prefix
-            try:
-                # Use HTML to control image size - height matches the boxes
-                st.markdown(
-                    f'<div style="height: 280px; display: flex; justify-content: center; align-items: center;">'
-                    f'<img src="data:image/png;base64,{get_base64_image(image_path)}" '
-                    f'style="height: 280px; width: auto; object-fit: contain; border-radius: 8px;" />'
-                    f'</div>',
-                    unsafe_allow_html=True
-                )
-                print(f"DEBUG: Successfully loaded image: {image_path}")
-            except Exception as e:
-                print(f"DEBUG: Could not load image {image_path}: {e}")
-                # Fallback: show a placeholder
-                st.markdown(
-                    f'<div class="box" style="height:280px; display:flex; flex-direction:column; justify-content:center; align-items:center;">'
-                    f'<span class="yellow-text" style="font-size:2rem; text-align:center;">{single_cc["name"]}</span><br>'
-                    f'<span class="gray-text" style="text-align:center;">Kundencenter</span>'
-                    '</div>',
-                    unsafe_allow_html=True
-                )
-
-        with col2:
-            # Gesamtverbrauch
-            st.markdown(
-                f'<div class="box flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
-                f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">⚡</span>'
-                f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 12px;">Gesamtverbrauch</div>'
-                f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["sum_usage"]:.0f}</span></div>'
-                f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
-                f'</div>',
-                unsafe_allow_html=True
-            )
-
-        with col3:
-            # Täglicher Durchschnitt
-            st.markdown(
-                f'<div class="box flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
-                f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">📅</span>'
-                f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 12px;">Täglicher Durchschnitt</div>'
-                f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["avg_usage"]:.2f}</span></div>'
-                f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
-                f'</div>',
-                unsafe_allow_html=True
-            )
-
-        with col4:
-            # Maximalverbrauch
-            st.markdown(
-                f'<div class="box box-red flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
-                f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">📈</span>'
-                f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 8px;">Maximalverbrauch</div>'
-                f'<div style="font-size: 1rem; color: white; margin-bottom: 8px;">{single_cc["max_usage"]["date"]}</div>'
-                f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["max_usage"]["consumption"]:.2f}</span></div>'
-                f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
-                f'</div>',
-                unsafe_allow_html=True
-            )
-
-        with col5:
-            # Minimalverbrauch
-            st.markdown(
-                f'<div class="box box-green flex-col" style="display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; height: 280px;">'
-                f'<span class="box-icon yellow-text" style="font-size: 2rem; margin-bottom: 8px;">📉</span>'
-                f'<div style="font-weight: bold; font-size: 1rem; margin-bottom: 8px;">Minimalverbrauch</div>'
-                f'<div style="font-size: 1rem; color: white; margin-bottom: 8px;">{single_cc["min_usage"]["date"]}</div>'
-                f'<div><span class="yellow-text" style="font-size: 1.5rem; font-weight: bold;">{single_cc["min_usage"]["consumption"]:.2f}</span></div>'
-                f'<div><span class="gray-text" style="font-size: 1rem;">kWh</span></div>'
-                f'</div>',
-                unsafe_allow_html=True
-            )
-
-        print(f"DEBUG: Rendering detail view for {single_cc['name']} - Sum: {single_cc['sum_usage']}, Avg: {single_cc['avg_usage']}")
-        print(f"DEBUG: Detail view Min/Max - Min: {single_cc['min_usage']}, Max: {single_cc['max_usage']}")
-    # Sleep for 3 seconds before next update (faster refresh for live data)
-    time.sleep(3)
\ No newline at end of file
+detail_section()
@@ -0,0 +1,167 @@
+import atexit
+import bisect
+import gzip
+import json
+import re
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+# Token fields that are replaced before a response is written to a trace
+REDACTED_FIELDS = ("access_token", "refresh_token")
+# Dates in request URLs (from=, to=, date=) and response bodies (dailyMetrics)
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def _request_key(method, url):
+    """Key a request by method, path and query, so a trace can be replayed against any host."""
+    parts = urlsplit(url)
+    return f"{method} {parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+def _shift_dates(text, days):
+    """Move every YYYY-MM-DD date in text by the given number of days."""
+    if not days:
+        return text
+
+    def shift(match):
+        try:
+            return (date.fromisoformat(match.group()) + timedelta(days=days)).isoformat()
+        except ValueError:
+            return match.group()
+
+    return DATE_PATTERN.sub(shift, text)
+
+class TraceRecorder:
+    """Writes every request/response pair of the hooked sessions to a gzipped JSON-lines trace file.
+    Each record holds the offset from the start of the recording, the request key, the status,
+    the response time and the response body.
+    The gzip stream is sync-flushed after every record, so everything up to the last record stays
+    readable if the process exits without close(); it is also closed at interpreter exit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"version": 1, "started": time.time()})
+        atexit.register(self.close)
+
+    def install(self, session):
+        """Record all responses received by a requests session.
+        Installing twice is a no-op, and hooks of other recorders on the session are replaced.
+        """
+        hooks = session.hooks["response"]
+        hooks[:] = [h for h in hooks if not isinstance(getattr(h, "__self__", None), TraceRecorder)]
+        hooks.append(self.hook)
+
+    def hook(self, response, *args, **kwargs):
+        body = response.text
+        if "/auth/" in response.url and response.ok:
+            data = response.json()
+            for field in REDACTED_FIELDS:
+                if field in data:
+                    data[field] = f"replayed-{field}"
+            body = json.dumps(data)
+        self._write({
+            "t": round(time.monotonic() - self.started, 3),
+            "key": _request_key(response.request.method, response.url),
+            "status": response.status_code,
+            "elapsed": round(response.elapsed.total_seconds(), 4),
+            "body": body,
+        })
+        return response
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line)
+            # Flushes the compressor with Z_SYNC_FLUSH, without ending the gzip stream
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+class TraceReplayer:
+    """Serves responses from a trace file written by TraceRecorder.
+    Time runs `speed` times faster than real time from the start of the replay; a request gets the
+    latest recorded response for its key at that point (or the first one if none was recorded yet).
+    A torn last record, e.g. from a recording process that was killed, is ignored.
+    The dashboards ask for dates relative to today, so with shift_dates all dates in requests and
+    responses are moved by the number of days between the recording and the replay.
+    """
+
+    def __init__(self, path, speed=1.0, replay_latency=True, shift_dates=True):
+        self.speed = speed
+        self.replay_latency = replay_latency
+        self.started = time.monotonic()
+        self.records = {}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != 1:
+                raise ValueError(f"Unsupported trace version in {path}: {header.get('version')}")
+            recorded = date.fromtimestamp(header["started"])
+            self.day_offset = (date.today() - recorded).days if shift_dates else 0
+            try:
+                for line in f:
+                    if not line.endswith("\n"):
+                        raise EOFError("incomplete last line")
+                    record = json.loads(line)
+                    self.records.setdefault(record["key"], []).append(record)
+            except EOFError as e:
+                print(f"DEBUG: Trace {path} ends with a truncated record ({e}), ignoring it")
+        # Offsets per key for bisecting by replay time
+        self.offsets = {key: [r["t"] for r in records] for key, records in self.records.items()}
+
+    def now(self):
+        """Current position in the trace in seconds."""
+        return (time.monotonic() - self.started) * self.speed
+
+    def lookup(self, method, url):
+        """Return the record to serve for a request, or None if the trace has no such request."""
+        key = _request_key(method, _shift_dates(url, -self.day_offset))
+        records = self.records.get(key)
+        if not records:
+            return None
+        index = bisect.bisect_right(self.offsets[key], self.now()) - 1
+        return records[max(index, 0)]
+
+    def install(self, session):
+        """Serve all requests of a requests session from the trace."""
+        adapter = ReplayAdapter(self)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+class ReplayAdapter(BaseAdapter):
+    """requests transport adapter answering from a TraceReplayer instead of the network."""
+
+    def __init__(self, replayer):
+        super().__init__()
+        self.replayer = replayer
+
+    def send(self, request, **kwargs):
+        record = self.replayer.lookup(request.method, request.url)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = "application/json"
+        if record is None:
+            response.status_code = 404
+            response._content = b'{"error": "request not in trace"}'
+            return response
+        if self.replayer.replay_latency:
+            time.sleep(record["elapsed"] / self.replayer.speed)
+        response.status_code = record["status"]
+        response._content = _shift_dates(record["body"], self.replayer.day_offset).encode("utf-8")
+        return response
+
+    def close(self):
+        pass